@@ -1,16 +1,28 @@
 """Проверка статуса оплаты Альфа-Банк + создание сертификата в Prime Hill"""
 import json
+import math
 import os
-import uuid
-import random
-import urllib.request
-import urllib.error
-import urllib.parse
-from datetime import datetime
-
-ALFA_API = "https://pay.alfabank.ru/payment/rest"
-PRIME_HILL_BASE = "https://open-api.p-h.app/api/v2"
-TEMPLATE_ID = 15852
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from shared import log, singleflight, status_poll
+from shared.alfa import alfa_request
+from shared.fulfillment import NO_RECIPIENT_ERROR, is_paid, order_payload
+from shared.metrics import instrumented
+from shared.outbox import DEAD, Outbox, drain_in_background
+from shared.profiling import profiled
+from shared.storage import FulfillmentStore, require_shared
+
+# Статусы, из которых заказ ещё может перейти в оплаченный: зарегистрирован, удержан, проверка 3-D Secure
+IN_PROGRESS_STATUSES = (0, 1, 5)
+# Сертификаты выпускает payment-callback: check-payment только читает статус и не ставит заказ в очередь,
+# иначе два контейнера выпустили бы по сертификату на один заказ
+CALLBACK_FULFILLMENT = os.environ.get("PAYMENT_CALLBACK_ENABLED", "") == "1"
+WAIT_MAX_SECONDS = float(os.environ.get("CHECK_PAYMENT_WAIT_MAX", "25"))
+ISSUE_POLL_SECONDS = 0.5
+
+STATUS_TEXT = {0: "Зарегистрирован", 1: "Удержана", 2: "Оплачен", 3: "Отменён", 4: "Возврат", 5: "По ACS", 6: "Отклонён"}
 
 CORS_HEADERS = {
     "Access-Control-Allow-Origin": "*",
@@ -21,126 +33,6 @@ CORS_HEADERS = {
 }
 
 
-def alfa_request(endpoint, params):
-    token = os.environ.get("ALFA_MERCHANT_TOKEN", "")
-    if token:
-        params["token"] = token
-    else:
-        params["userName"] = os.environ.get("ALFA_MERCHANT_LOGIN", "")
-        params["password"] = os.environ.get("ALFA_MERCHANT_PASSWORD", "")
-    url = f"{ALFA_API}/{endpoint}"
-    body = urllib.parse.urlencode(params).encode("utf-8")
-    req = urllib.request.Request(url, data=body, method="POST", headers={"Content-Type": "application/x-www-form-urlencoded"})
-    try:
-        with urllib.request.urlopen(req, timeout=15) as resp:
-            raw = resp.read().decode("utf-8")
-            return json.loads(raw) if raw else {}
-    except urllib.error.HTTPError as e:
-        err = e.read().decode("utf-8") if e.fp else ""
-        return {"errorCode": str(e.code), "errorMessage": err}
-    except Exception as e:
-        return {"errorCode": "500", "errorMessage": str(e)}
-
-
-def ph_request(method, endpoint, data=None, params=None):
-    token = os.environ.get("PRIME_HILL_API_KEY", "")
-    if params is None:
-        params = {}
-    params["token"] = token
-    query_string = urllib.parse.urlencode(params)
-    url = f"{PRIME_HILL_BASE}/{endpoint}?{query_string}"
-    req_body = json.dumps(data).encode("utf-8") if data else None
-    req = urllib.request.Request(url, data=req_body, method=method, headers={"Content-Type": "application/json"} if req_body else {})
-    try:
-        with urllib.request.urlopen(req, timeout=15) as resp:
-            raw = resp.read().decode("utf-8")
-            return {"ok": True, "status": resp.status, "data": json.loads(raw) if raw else {}}
-    except urllib.error.HTTPError as e:
-        err = e.read().decode("utf-8") if e.fp else ""
-        try:
-            err = json.loads(err)
-        except Exception:
-            pass
-        return {"ok": False, "status": e.code, "error": err}
-    except Exception as e:
-        return {"ok": False, "status": 500, "error": str(e)}
-
-
-def create_certificate(recipient_name, sender_name, nominal):
-    name_parts = recipient_name.split(" ", 2)
-    first_name = name_parts[0] if len(name_parts) > 0 else recipient_name
-    last_name = name_parts[1] if len(name_parts) > 1 else ""
-    patronymic = name_parts[2] if len(name_parts) > 2 else ""
-
-    create_result = ph_request("POST", "createClients", data={
-        "clients": [{
-            "lastName": last_name if last_name else "Сертификат",
-            "firstName": first_name,
-            "patronymic": patronymic if patronymic else "",
-            "birthday": "2000-01-01",
-            "sex": 0,
-            "email": "",
-            "phone": "7" + str(random.randint(9000000000, 9999999999)),
-            "templateId": TEMPLATE_ID,
-            "cardNumber": "",
-            "cardBarcode": "",
-            "comment": f"Сертификат Sweep GIFT на {nominal} руб." + (f" от {sender_name}" if sender_name else ""),
-            "parent": 0,
-            "tags": [],
-        }]
-    })
-    print("=== createClients response ===")
-    print(json.dumps(create_result, ensure_ascii=False))
-
-    if not create_result.get("ok"):
-        return None, "Ошибка создания клиента в Prime Hill"
-
-    clients_list = create_result.get("data", {}).get("response", [])
-    if not clients_list:
-        return None, "Prime Hill не вернул данные клиента"
-
-    client = clients_list[0]
-    client_id = client.get("clientId", 0)
-    card_number = client.get("cardNumber", "")
-    card_barcode = client.get("cardBarcode", "")
-    card_hash = client.get("hash", "")
-
-    order_guid = str(uuid.uuid4()).replace("-", "")[:16]
-    deposit_result = ph_request("POST", "createOrder", data={
-        "guid": order_guid,
-        "number": f"SG-{order_guid[:8]}",
-        "date": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
-        "sum": 0,
-        "sumDiscount": 0,
-        "bonusAdd": 0,
-        "bonusWriteOff": 0,
-        "depositAdd": float(nominal),
-        "depositWriteOff": 0,
-        "cart": [{
-            "name": f"Подарочный сертификат {nominal} руб.",
-            "nid": order_guid,
-            "groupId": "certificates",
-            "groupName": "Сертификаты",
-            "price": float(nominal),
-            "priceWithDiscount": float(nominal),
-            "amount": 1,
-        }],
-    }, params={"type": "clientId", "id": str(client_id)})
-    print("=== createOrder response ===")
-    print(json.dumps(deposit_result, ensure_ascii=False))
-
-    return {
-        "clientId": str(client_id),
-        "cardNumber": str(card_number),
-        "cardBarcode": str(card_barcode),
-        "cardHash": card_hash,
-        "recipientName": recipient_name,
-        "senderName": sender_name,
-        "nominal": nominal,
-        "qrUrl": str(card_number),
-    }, None
-
-
 def parse_body(event):
     raw = event.get("body", "{}")
     if isinstance(raw, dict):
@@ -153,81 +45,163 @@ def parse_body(event):
     return {}
 
 
-def handler(event, context):
-    """Проверка оплаты через Альфа-Банк и создание сертификата после успешной оплаты"""
-    if event.get("httpMethod") == "OPTIONS":
-        return {"statusCode": 200, "headers": CORS_HEADERS, "body": ""}
+def pending_response(queued):
+    """Оплаченный заказ уже в очереди выпуска: ответ сразу, выпуск — в фоне"""
+    if queued["status"] == DEAD:
+        return {
+            "statusCode": 502,
+            "headers": CORS_HEADERS,
+            "body": json.dumps({"paid": True, "error": "Не удалось выпустить сертификат, обратитесь в поддержку"}),
+        }
 
-    if event.get("httpMethod") != "POST":
-        return {"statusCode": 405, "headers": CORS_HEADERS, "body": json.dumps({"error": "Method not allowed"})}
+    if not CALLBACK_FULFILLMENT:
+        drain_in_background()
+    return {
+        "statusCode": 202,
+        "headers": CORS_HEADERS,
+        "body": json.dumps({"paid": True, "pending": True, "attempts": queued["attempts"]}),
+    }
 
-    body = parse_body(event)
-    order_id = body.get("orderId", "").strip()
 
-    if not order_id:
-        return {"statusCode": 400, "headers": CORS_HEADERS, "body": json.dumps({"error": "orderId обязателен"})}
+def unavailable(result):
+    """Цепь к Альфа-Банку разомкнута: быстрый ответ 503, который клиент может повторить"""
+    retry_after = result.get("retryAfter", 1)
+    return {
+        "statusCode": 503,
+        "headers": dict(CORS_HEADERS, **{"Retry-After": str(retry_after)}),
+        "body": json.dumps({"error": result.get("errorMessage", ""), "retryable": True, "retryAfter": retry_after}),
+    }
+
 
+def known_state(order_id):
+    """Ответ по уже выпущенному или стоящему в очереди заказу — без обращения к внешним API"""
+    issued = FulfillmentStore().get(order_id)
+    if issued:
+        return {
+            "statusCode": 200,
+            "headers": CORS_HEADERS,
+            "body": json.dumps({"paid": True, "success": True, "certificate": issued}),
+        }
+
+    queued = Outbox().get(order_id)
+    if queued:
+        return pending_response(queued)
+    return None
+
+
+def fetch_status(order_id):
     status_result = alfa_request("getOrderStatusExtended.do", {"orderId": order_id})
-    print("=== getOrderStatusExtended ===")
-    print(json.dumps(status_result, ensure_ascii=False))
+    log.debug("alfa.getOrderStatusExtended", orderId=order_id, response=status_result)
+    return status_result
+
+
+def is_final(status_result):
+    """Ответ, после которого ждать нечего: ошибка шлюза или статус, который уже не станет оплатой"""
+    return status_result.get("orderStatus", -1) not in IN_PROGRESS_STATUSES
+
+
+def check_order(order_id):
+    return status_response(order_id, fetch_status(order_id))
+
+
+def wait_order(order_id, deadline):
+    """Long-poll: статус в Альфа-Банке опрашивается по общему для всех ожидающих графику, затем — до выпуска
+    сертификата; ответ возвращается сразу при окончательном результате или по истечении deadline"""
+    while True:
+        response = known_state(order_id)
+        if response is None:
+            status_result = status_poll.wait(
+                f"check-payment:{order_id}",
+                lambda: fetch_status(order_id),
+                is_final,
+                deadline,
+                cacheable=lambda result: "orderStatus" in result,
+            )
+            response = status_response(order_id, status_result) if status_result is not None else check_order(order_id)
+        if response["statusCode"] != 202 or time.time() >= deadline:
+            return response
+        time.sleep(min(ISSUE_POLL_SECONDS, max(deadline - time.time(), 0)))
+
+
+def status_response(order_id, status_result):
+    if status_result.get("circuitOpen"):
+        return unavailable(status_result)
 
     order_status = status_result.get("orderStatus", -1)
-    action_code = status_result.get("actionCode", -1)
 
-    if order_status != 2 or action_code != 0:
-        status_text = {0: "Зарегистрирован", 1: "Удержана", 2: "Оплачен", 3: "Отменён", 4: "Возврат", 5: "По ACS", 6: "Отклонён"}.get(order_status, "Неизвестен")
+    if not is_paid(status_result):
         return {
             "statusCode": 200,
             "headers": CORS_HEADERS,
             "body": json.dumps({
                 "paid": False,
                 "orderStatus": order_status,
-                "statusText": status_text,
+                "statusText": STATUS_TEXT.get(order_status, "Неизвестен"),
+                "final": is_final(status_result),
                 "actionCodeDescription": status_result.get("actionCodeDescription", ""),
             }),
         }
 
-    merchant_params = {}
-    json_params = status_result.get("merchantOrderParams", [])
-    for p in json_params:
-        merchant_params[p.get("name", "")] = p.get("value", "")
-
-    jp = status_result.get("orderDescription", "")
-    try:
-        order_data = json.loads(merchant_params.get("jsonParams", "{}"))
-    except Exception:
-        order_data = {}
-
-    recipient_name = order_data.get("recipientName", "")
-    sender_name = order_data.get("senderName", "")
-    nominal = order_data.get("nominal", 0)
-    amount = status_result.get("amount", 0)
+    if CALLBACK_FULFILLMENT:
+        return {"statusCode": 202, "headers": CORS_HEADERS, "body": json.dumps({"paid": True, "pending": True})}
 
-    if not nominal and amount:
-        nominal = amount // 100
-
-    if not recipient_name:
+    payload = order_payload(status_result)
+    if not payload:
         return {
             "statusCode": 200,
             "headers": CORS_HEADERS,
-            "body": json.dumps({"paid": True, "error": "Не удалось получить данные получателя из заказа"}),
+            "body": json.dumps({"paid": True, "error": NO_RECIPIENT_ERROR}),
         }
 
-    certificate, error = create_certificate(recipient_name, sender_name, nominal)
+    outbox = Outbox()
+    outbox.enqueue(order_id, payload)
+    return pending_response(outbox.get(order_id))
 
-    if error:
-        return {
-            "statusCode": 502,
-            "headers": CORS_HEADERS,
-            "body": json.dumps({"paid": True, "error": error}),
-        }
 
-    return {
-        "statusCode": 200,
-        "headers": CORS_HEADERS,
-        "body": json.dumps({
-            "paid": True,
-            "success": True,
-            "certificate": certificate,
-        }),
-    }
\ No newline at end of file
+@instrumented("check-payment")
+@profiled("check-payment")
+def handler(event, context):
+    """Проверка оплаты через Альфа-Банк и создание сертификата после успешной оплаты;
+    с waitSeconds ответ ждёт окончательного статуса или выпуска сертификата не дольше указанного"""
+    if event.get("httpMethod") == "OPTIONS":
+        return {"statusCode": 200, "headers": CORS_HEADERS, "body": ""}
+
+    if event.get("httpMethod") != "POST":
+        return {"statusCode": 405, "headers": CORS_HEADERS, "body": json.dumps({"error": "Method not allowed"})}
+
+    body = parse_body(event)
+    order_id = body.get("orderId", "").strip()
+
+    if not order_id:
+        return {"statusCode": 400, "headers": CORS_HEADERS, "body": json.dumps({"error": "orderId обязателен"})}
+
+    try:
+        wait_seconds = float(body.get("waitSeconds") or 0)
+    except (TypeError, ValueError):
+        wait_seconds = None
+    # nan и inf прошли бы min/max и дали дедлайн, который никогда не наступит
+    if wait_seconds is None or not math.isfinite(wait_seconds):
+        return {"statusCode": 400, "headers": CORS_HEADERS, "body": json.dumps({"error": "waitSeconds должен быть числом"})}
+    wait_seconds = min(max(wait_seconds, 0), WAIT_MAX_SECONDS)
+
+    # Очередь выпуска и выданные сертификаты должны быть общими для всех контейнеров: иначе заказ,
+    # выпущенный в одном контейнере (или payment-callback), другой контейнер выпустил бы ещё раз
+    try:
+        require_shared("чтение сертификатов, выпущенных payment-callback" if CALLBACK_FULFILLMENT else "выпуск сертификатов")
+    except RuntimeError as e:
+        log.error("check-payment.no_shared_store", error=str(e))
+        return {"statusCode": 500, "headers": CORS_HEADERS, "body": json.dumps({"error": str(e)})}
+
+    if wait_seconds:
+        return wait_order(order_id, time.time() + wait_seconds)
+
+    known = known_state(order_id)
+    if known:
+        return known
+
+    # Двойные клики и несколько вкладок: статус в Альфа-Банке запрашивает только первый запрос по orderId
+    return singleflight.run(
+        f"check-payment:{order_id}",
+        lambda: check_order(order_id),
+        ready=lambda: known_state(order_id),
+    )
@@ -1,15 +1,26 @@
 """Создание электронного сертификата через Prime Hill Open API v2"""
 import json
 import os
-import uuid
-import random
-import urllib.request
-import urllib.error
-import urllib.parse
-from datetime import datetime
+import sys
+from itertools import islice
 
-PRIME_HILL_BASE = "https://open-api.p-h.app/api/v2"
-TEMPLATE_ID = 15852
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from shared import balance, breaker, log, metrics, ratelimit
+from shared.identity import allocate_phones
+from shared.ledger import CertificateLedger
+from shared.metrics import instrumented
+from shared.primehill import build_client, build_deposit_order, gen_phone, ph_cached_get, ph_request
+from shared.profiling import profiled
+from shared.storage import require_shared
+
+BULK_MAX_ITEMS = 1000
+BULK_CHUNK_SIZE = int(os.environ.get("BULK_CHUNK_SIZE", "100"))
+BULK_WORKERS = int(os.environ.get("BULK_WORKERS", "8"))
+
+CLIENTS_PAGE_DEFAULT = 100
+CLIENTS_PAGE_MAX = 500
+
+BALANCE_BATCH_MAX = int(os.environ.get("BALANCE_BATCH_MAX", "100"))
 
 CORS_HEADERS = {
     "Access-Control-Allow-Origin": "*",
@@ -20,39 +31,6 @@ CORS_HEADERS = {
 }
 
 
-def ph_request(method, endpoint, data=None, params=None):
-    token = os.environ.get("PRIME_HILL_API_KEY", "")
-    if params is None:
-        params = {}
-    params["token"] = token
-
-    query_string = urllib.parse.urlencode(params)
-    url = f"{PRIME_HILL_BASE}/{endpoint}?{query_string}"
-
-    body = None
-    if data is not None:
-        body = json.dumps(data).encode("utf-8")
-
-    req = urllib.request.Request(
-        url, data=body, method=method,
-        headers={"Content-Type": "application/json"} if body else {},
-    )
-
-    try:
-        with urllib.request.urlopen(req, timeout=15) as resp:
-            raw = resp.read().decode("utf-8")
-            return {"ok": True, "status": resp.status, "data": json.loads(raw) if raw else {}}
-    except urllib.error.HTTPError as e:
-        err = e.read().decode("utf-8") if e.fp else ""
-        try:
-            err = json.loads(err)
-        except Exception:
-            pass
-        return {"ok": False, "status": e.code, "error": err}
-    except Exception as e:
-        return {"ok": False, "status": 500, "error": str(e)}
-
-
 def parse_body(event):
     raw = event.get("body", "{}")
     if isinstance(raw, dict):
@@ -65,10 +43,240 @@ def parse_body(event):
     return {}
 
 
-def gen_phone():
-    return "7" + str(random.randint(9000000000, 9999999999))
+def project_client(client):
+    return {
+        "id": client.get("clientId", client.get("id")),
+        "cardNumber": client.get("cardNumber", ""),
+        "balance": client.get("balance", client.get("deposit", 0)),
+        "comment": client.get("comment", ""),
+    }
+
+
+def clients_page(query):
+    """Страница клиентов из закэшированного getClients: тело ответа собирается по элементам только этой страницы"""
+    try:
+        cursor = max(int(query.get("cursor") or 0), 0)
+        limit = min(max(int(query.get("limit") or CLIENTS_PAGE_DEFAULT), 1), CLIENTS_PAGE_MAX)
+    except ValueError:
+        return {"statusCode": 400, "headers": CORS_HEADERS, "body": json.dumps({"error": "cursor и limit должны быть числами"})}
+
+    result = ph_cached_get("getClients")
+    if result.get("retryable"):
+        return unavailable(result)
+    if not result.get("ok"):
+        return {"statusCode": 200, "headers": CORS_HEADERS, "body": json.dumps(result)}
+
+    clients = result.get("data", {}).get("response", [])
+    total = len(clients)
+    next_cursor = cursor + limit if cursor + limit < total else None
+
+    def chunks():
+        yield '{"ok": true, "items": ['
+        for i, client in enumerate(islice(clients, cursor, cursor + limit)):
+            if i:
+                yield ", "
+            yield json.dumps(project_client(client))
+        yield '], "total": %d, "nextCursor": %s}' % (total, json.dumps(str(next_cursor) if next_cursor is not None else None))
+
+    return {"statusCode": 200, "headers": CORS_HEADERS, "body": "".join(chunks())}
+
+
+def ledger_search(query):
+    """Поиск по локальному реестру: номер карты, номер заказа или начало имени получателя"""
+    try:
+        require_shared("поиск по реестру")
+    except RuntimeError as e:
+        # Без общей базы реестр показал бы только сертификаты, выпущенные этим контейнером
+        log.error("ledger.no_shared_store", error=str(e))
+        return {"statusCode": 500, "headers": CORS_HEADERS, "body": json.dumps({"error": str(e)})}
+
+    try:
+        cursor = max(int(query.get("cursor") or 0), 0)
+        limit = min(max(int(query.get("limit") or CLIENTS_PAGE_DEFAULT), 1), CLIENTS_PAGE_MAX)
+    except ValueError:
+        return {"statusCode": 400, "headers": CORS_HEADERS, "body": json.dumps({"error": "cursor и limit должны быть числами"})}
+
+    ledger = CertificateLedger()
+    items, total = ledger.search(query.get("q", ""), cursor, limit)
+    next_cursor = cursor + limit if cursor + limit < total else None
+    return {
+        "statusCode": 200,
+        "headers": CORS_HEADERS,
+        "body": json.dumps({
+            "ok": True,
+            "items": items,
+            "total": total,
+            "nextCursor": str(next_cursor) if next_cursor is not None else None,
+            "summary": ledger.summary(),
+        }, ensure_ascii=False),
+    }
+
+
+def card_balances(query):
+    """Остатки по card=номер[,номер...] и/или hash=hash[,hash...] одним запросом"""
+    lookups = [
+        (lookup_type, value.strip())
+        for lookup_type, param in (("cardNumber", "card"), ("hash", "hash"))
+        for value in (query.get(param) or "").split(",") if value.strip()
+    ]
+    if not lookups:
+        return {"statusCode": 400, "headers": CORS_HEADERS, "body": json.dumps({"error": "Укажите card или hash"})}
+    if len(lookups) > BALANCE_BATCH_MAX:
+        return {
+            "statusCode": 400,
+            "headers": CORS_HEADERS,
+            "body": json.dumps({"error": f"Не больше {BALANCE_BATCH_MAX} карт за запрос"}),
+        }
+
+    items = []
+    for (lookup_type, value), result in zip(lookups, balance.balances(lookups)):
+        if len(lookups) == 1 and result.get("retryable"):
+            return unavailable(result)
+        if len(lookups) == 1 and result.get("status") == 404:
+            return {"statusCode": 404, "headers": CORS_HEADERS, "body": json.dumps({"error": result["error"]})}
+        item = {lookup_type: value}
+        if result.get("ok"):
+            item.update(result["data"], cached=result["cached"])
+        else:
+            item.update(error=result.get("error", ""), retryable=bool(result.get("retryable")))
+        items.append(item)
+    return {"statusCode": 200, "headers": CORS_HEADERS, "body": json.dumps({"ok": True, "items": items})}
+
+
+def validate_item(item):
+    if not isinstance(item, dict):
+        return "Некорректная позиция"
+    recipient_name = str(item.get("recipientName", "")).strip()
+    nominal = item.get("nominal", 0)
+    if not recipient_name or not nominal:
+        return "recipientName и nominal обязательны"
+    if not isinstance(nominal, (int, float)) or nominal < 500:
+        return "Минимальная сумма сертификата 500 ₽"
+    return None
+
+
+def failed_item(error, result):
+    """Неуспешная позиция пакета; при разомкнутой цепи или лимите запросов позицию можно безопасно повторить"""
+    if result.get("retryable"):
+        return {"success": False, "error": result["error"], "retryable": True}
+    return {"success": False, "error": error}
+
+
+def unavailable(result):
+    """Цепь к Prime Hill разомкнута или исчерпан лимит запросов: быстрый ответ, который клиент может повторить"""
+    retry_after = result.get("retryAfter", 1)
+    return {
+        "statusCode": 429 if result.get("rateLimited") else 503,
+        "headers": dict(CORS_HEADERS, **{"Retry-After": str(retry_after)}),
+        "body": json.dumps({"error": result.get("error", ""), "retryable": True, "retryAfter": retry_after}),
+    }
+
+
+def phone_key(phone):
+    """Последние десять цифр: Prime Hill может вернуть телефон с +, пробелами, скобками или с 8 вместо 7"""
+    return "".join(ch for ch in str(phone) if ch.isdigit())[-10:]
 
 
+def register_chunk(chunk):
+    """Регистрирует пачку получателей одним createClients; возвращает ({index: client}, {index: ошибка}).
+
+    Клиенты сопоставляются с получателями по телефону. Если телефоны не совпали, а Prime Hill вернул
+    ровно столько клиентов, сколько отправлено, и без ошибок, — по порядку в ответе.
+    """
+    phones = {}
+    clients = []
+    for (index, item), phone in zip(chunk, allocate_phones(len(chunk))):
+        phones[phone_key(phone)] = index
+        clients.append(build_client(item["recipientName"], item["senderName"], item["nominal"], phone))
+
+    create_result = ph_request("POST", "createClients", data={"clients": clients})
+    if not create_result.get("ok"):
+        failure = failed_item("Ошибка создания клиента в Prime Hill", create_result)
+        return {}, {index: dict(failure) for index, _ in chunk}
+
+    api_data = create_result.get("data", {})
+    api_errors = api_data.get("errors", [])
+    if api_errors:
+        log.warning("primehill.createClients errors", errors=api_errors)
+
+    response = api_data.get("response", [])
+    registered = {}
+    for client in response:
+        index = phones.get(phone_key(client.get("phone", "")))
+        if index is not None:
+            registered[index] = client
+    if len(registered) < len(chunk) and len(response) == len(chunk) and not api_errors:
+        registered = {index: client for (index, _), client in zip(chunk, response)}
+    failed = {
+        index: {"success": False, "error": "Prime Hill не вернул данные клиента"}
+        for index, _ in chunk if index not in registered
+    }
+    return registered, failed
+
+
+def deposit(item, client):
+    client_id = client.get("clientId", 0)
+    # Клиент уже создан: отказ лимитера оставил бы его без пополнения, поэтому токен ждём без срока
+    deposit_result = ph_request(
+        "POST", "createOrder", data=build_deposit_order(item["nominal"]),
+        params={"type": "clientId", "id": str(client_id)}, max_wait=None,
+    )
+    certificate = {
+        "clientId": str(client_id),
+        "cardNumber": str(client.get("cardNumber", "")),
+        "cardBarcode": str(client.get("cardBarcode", "")),
+        "cardHash": client.get("hash", ""),
+        "recipientName": item["recipientName"],
+        "senderName": item["senderName"],
+        "nominal": item["nominal"],
+        "qrUrl": str(client.get("cardNumber", "")),
+    }
+    if not deposit_result.get("ok"):
+        return dict(failed_item("Ошибка пополнения депозита в Prime Hill", deposit_result), certificate=certificate)
+    return {"success": True, "certificate": certificate}
+
+
+def issue_bulk(items):
+    """Массовый выпуск: createClients пачками по BULK_CHUNK_SIZE, затем параллельные createOrder"""
+    from concurrent.futures import ThreadPoolExecutor
+
+    results = [None] * len(items)
+    valid = []
+    for index, item in enumerate(items):
+        error = validate_item(item)
+        if error:
+            results[index] = {"success": False, "error": error}
+            continue
+        valid.append((index, {
+            "recipientName": str(item["recipientName"]).strip(),
+            "senderName": str(item.get("senderName", "")).strip(),
+            "nominal": item["nominal"],
+        }))
+
+    chunks = [valid[i:i + BULK_CHUNK_SIZE] for i in range(0, len(valid), BULK_CHUNK_SIZE)]
+    with ThreadPoolExecutor(max_workers=BULK_WORKERS) as pool:
+        registered = {}
+        for chunk_registered, chunk_failed in pool.map(metrics.propagate(register_chunk), chunks):
+            registered.update(chunk_registered)
+            for index, failure in chunk_failed.items():
+                results[index] = failure
+
+        deposit_item = metrics.propagate(deposit)
+        futures = {
+            index: pool.submit(deposit_item, item, registered[index])
+            for index, item in valid if index in registered
+        }
+        for index, future in futures.items():
+            results[index] = future.result()
+
+    for index, result in enumerate(results):
+        result["index"] = index
+    CertificateLedger().record([result["certificate"] for result in results if result.get("success")])
+    return results
+
+
+@instrumented("create-certificate")
+@profiled("create-certificate")
 def handler(event, context):
     """Создание электронного сертификата: регистрация клиента в Prime Hill + пополнение депозита"""
     if event.get("httpMethod") == "OPTIONS":
@@ -79,26 +287,56 @@ def handler(event, context):
     if method == "GET":
         action = (event.get("queryStringParameters") or {}).get("action", "")
 
-        if action == "ping":
-            return {"statusCode": 200, "headers": CORS_HEADERS, "body": json.dumps(ph_request("GET", "ping"))}
+        if action in ("ping", "templates"):
+            result = ph_cached_get("ping" if action == "ping" else "getTemplates")
+            if result.get("retryable"):
+                return unavailable(result)
+            return {"statusCode": 200, "headers": CORS_HEADERS, "body": json.dumps(result)}
+
+        if action == "breakers":
+            return {"statusCode": 200, "headers": CORS_HEADERS, "body": json.dumps(breaker.snapshot())}
+
+        if action == "balance":
+            return card_balances(event.get("queryStringParameters") or {})
+
+        if action == "search":
+            return ledger_search(event.get("queryStringParameters") or {})
 
-        if action == "templates":
-            return {"statusCode": 200, "headers": CORS_HEADERS, "body": json.dumps(ph_request("GET", "getTemplates"))}
+        if action == "limits":
+            return {"statusCode": 200, "headers": CORS_HEADERS, "body": json.dumps(ratelimit.TokenBucket().snapshot())}
+
+        if action == "metrics":
+            return {"statusCode": 200, "headers": CORS_HEADERS, "body": json.dumps(metrics.snapshot())}
 
         if action == "clients":
-            result = ph_request("GET", "getClients")
-            return {"statusCode": 200, "headers": CORS_HEADERS, "body": json.dumps(result)}
+            return clients_page(event.get("queryStringParameters") or {})
 
         return {
             "statusCode": 200,
             "headers": CORS_HEADERS,
-            "body": json.dumps({"status": "ok", "service": "Sweep GIFT", "actions": ["ping", "templates", "clients"]}),
+            "body": json.dumps({"status": "ok", "service": "Sweep GIFT", "actions": ["ping", "templates", "clients", "search", "balance", "metrics", "breakers", "limits"]}),
         }
 
     if method != "POST":
         return {"statusCode": 405, "headers": CORS_HEADERS, "body": json.dumps({"error": "Method not allowed"})}
 
     body = parse_body(event)
+
+    if "certificates" in body:
+        items = body.get("certificates")
+        if not isinstance(items, list) or not items:
+            return {"statusCode": 400, "headers": CORS_HEADERS, "body": json.dumps({"error": "certificates должен быть непустым списком"})}
+        if len(items) > BULK_MAX_ITEMS:
+            return {"statusCode": 400, "headers": CORS_HEADERS, "body": json.dumps({"error": f"Не более {BULK_MAX_ITEMS} сертификатов за запрос"})}
+
+        results = issue_bulk(items)
+        issued = sum(1 for r in results if r["success"])
+        return {
+            "statusCode": 200,
+            "headers": CORS_HEADERS,
+            "body": json.dumps({"success": issued == len(results), "issued": issued, "failed": len(results) - issued, "results": results}),
+        }
+
     recipient_name = body.get("recipientName", "").strip()
     sender_name = body.get("senderName", "").strip()
     nominal = body.get("nominal", 0)
@@ -108,33 +346,13 @@ def handler(event, context):
     if nominal < 500:
         return {"statusCode": 400, "headers": CORS_HEADERS, "body": json.dumps({"error": "Минимальная сумма сертификата 500 ₽"})}
 
-    name_parts = recipient_name.split(" ", 2)
-    first_name = name_parts[0] if len(name_parts) > 0 else recipient_name
-    last_name = name_parts[1] if len(name_parts) > 1 else ""
-    patronymic = name_parts[2] if len(name_parts) > 2 else ""
-
-    client_payload = {
-        "clients": [{
-            "lastName": last_name if last_name else "Сертификат",
-            "firstName": first_name,
-            "patronymic": patronymic if patronymic else "",
-            "birthday": "2000-01-01",
-            "sex": 0,
-            "email": "",
-            "phone": gen_phone(),
-            "templateId": TEMPLATE_ID,
-            "cardNumber": "",
-            "cardBarcode": "",
-            "comment": f"Сертификат Sweep GIFT на {nominal} руб." + (f" от {sender_name}" if sender_name else ""),
-            "parent": 0,
-            "tags": [],
-        }]
-    }
-    print("=== createClients payload ===")
-    print(json.dumps(client_payload, ensure_ascii=False))
+    client_payload = {"clients": [build_client(recipient_name, sender_name, nominal, gen_phone())]}
+    log.debug("primehill.createClients payload", payload=client_payload)
     create_result = ph_request("POST", "createClients", data=client_payload)
-    print("=== createClients response ===")
-    print(json.dumps(create_result, ensure_ascii=False))
+    log.debug("primehill.createClients", response=create_result)
+
+    if create_result.get("retryable"):
+        return unavailable(create_result)
 
     if not create_result.get("ok"):
         return {
@@ -148,8 +366,7 @@ def handler(event, context):
     api_errors = api_data.get("errors", [])
 
     if api_errors and len(api_errors) > 0:
-        print("=== Prime Hill errors ===")
-        print(json.dumps(api_errors, ensure_ascii=False))
+        log.warning("primehill.createClients errors", errors=api_errors)
 
     if not clients_list or len(clients_list) == 0:
         return {
@@ -159,67 +376,60 @@ def handler(event, context):
         }
 
     client = clients_list[0]
-    print("=== created client ===")
-    print(json.dumps(client, ensure_ascii=False))
 
     client_id = client.get("clientId", 0)
     card_hash = client.get("hash", "")
     card_number = client.get("cardNumber", "")
     card_barcode = client.get("cardBarcode", "")
 
-    verify = ph_request("GET", "getClients", params={"clientId": client_id})
-    print("=== verify getClients ===")
-    print(json.dumps(verify, ensure_ascii=False))
-
-    order_guid = str(uuid.uuid4()).replace("-", "")[:16]
-    order_payload = {
-        "guid": order_guid,
-        "number": f"SG-{order_guid[:8]}",
-        "date": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
-        "sum": 0,
-        "sumDiscount": 0,
-        "bonusAdd": 0,
-        "bonusWriteOff": 0,
-        "depositAdd": float(nominal),
-        "depositWriteOff": 0,
-        "cart": [
-            {
-                "name": f"Подарочный сертификат {nominal} руб.",
-                "nid": order_guid,
-                "groupId": "certificates",
-                "groupName": "Сертификаты",
-                "price": float(nominal),
-                "priceWithDiscount": float(nominal),
-                "amount": 1,
-            }
-        ],
-    }
+    # Контрольное чтение клиента нужно только для отладки: без debug лишний запрос к Prime Hill не делается
+    if log.enabled("debug"):
+        verify = ph_request("GET", "getClients", params={"clientId": client_id})
+        log.debug("primehill.getClients verify", clientId=client_id, response=verify)
+
+    order_payload = build_deposit_order(nominal)
     order_params = {
         "type": "clientId",
         "id": str(client_id),
     }
-    print("=== createOrder payload ===")
-    print(json.dumps(order_payload, ensure_ascii=False))
-    print(f"=== createOrder query: type=clientId, id={client_id} ===")
-    deposit_result = ph_request("POST", "createOrder", data=order_payload, params=order_params)
-    print("=== createOrder response ===")
-    print(json.dumps(deposit_result, ensure_ascii=False))
+    log.debug("primehill.createOrder payload", payload=order_payload, params=order_params)
+    # Клиент уже создан: отказ лимитера оставил бы карту без пополнения, поэтому токен ждём без срока
+    deposit_result = ph_request("POST", "createOrder", data=order_payload, params=order_params, max_wait=None)
+    log.debug("primehill.createOrder", clientId=client_id, response=deposit_result)
+
+    certificate = {
+        "clientId": str(client_id),
+        "cardNumber": str(card_number),
+        "cardBarcode": str(card_barcode),
+        "cardHash": card_hash,
+        "recipientName": recipient_name,
+        "senderName": sender_name,
+        "nominal": nominal,
+        "qrUrl": str(card_number),
+    }
+    if not deposit_result.get("ok"):
+        # Карта создана, но не пополнена: не выдаём её за выпущенный сертификат и не пишем в реестр
+        log.warning("primehill.createOrder failed", clientId=client_id, error=deposit_result.get("error"))
+        return {
+            "statusCode": 502,
+            "headers": CORS_HEADERS,
+            "body": json.dumps({
+                "success": False,
+                "error": "Ошибка пополнения депозита в Prime Hill",
+                "certificate": certificate,
+                "depositResult": deposit_result,
+            }),
+        }
+
+    CertificateLedger().record([certificate])
+    log.info("certificate.issued", clientId=client_id, nominal=nominal)
 
     return {
         "statusCode": 200,
         "headers": CORS_HEADERS,
         "body": json.dumps({
             "success": True,
-            "certificate": {
-                "clientId": str(client_id),
-                "cardNumber": str(card_number),
-                "cardBarcode": str(card_barcode),
-                "cardHash": card_hash,
-                "recipientName": recipient_name,
-                "senderName": sender_name,
-                "nominal": nominal,
-                "qrUrl": str(card_number),
-            },
+            "certificate": certificate,
             "depositResult": deposit_result,
         }),
     }
\ No newline at end of file
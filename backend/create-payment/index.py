@@ -1,55 +1,24 @@
 """Создание платежа через Альфа-Банк эквайринг (register.do)"""
 import json
 import os
-import uuid
-import urllib.request
-import urllib.error
-import urllib.parse
+import sys
 
-ALFA_API = "https://pay.alfabank.ru/payment/rest"
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from shared import log, singleflight
+from shared.alfa import alfa_request
+from shared.idempotency import IdempotencyStore, fingerprint, request_key
+from shared.metrics import instrumented
+from shared.profiling import profiled
 
 CORS_HEADERS = {
     "Access-Control-Allow-Origin": "*",
     "Access-Control-Allow-Methods": "GET, POST, PUT, DELETE, OPTIONS",
-    "Access-Control-Allow-Headers": "Content-Type, X-User-Id, X-Auth-Token, X-Session-Id",
+    "Access-Control-Allow-Headers": "Content-Type, X-User-Id, X-Auth-Token, X-Session-Id, Idempotency-Key",
     "Access-Control-Max-Age": "86400",
     "Content-Type": "application/json",
 }
 
 
-def alfa_request(endpoint, params):
-    token = os.environ.get("ALFA_MERCHANT_TOKEN", "")
-    if token:
-        params["token"] = token
-        print(f"=== AUTH via token, len={len(token)} ===")
-    else:
-        login = os.environ.get("ALFA_MERCHANT_LOGIN", "")
-        password = os.environ.get("ALFA_MERCHANT_PASSWORD", "")
-        params["userName"] = login
-        params["password"] = password
-        print(f"=== AUTH via login/password, login='{login}' ===")
-
-    url = f"{ALFA_API}/{endpoint}"
-    body = urllib.parse.urlencode(params).encode("utf-8")
-    print(f"=== REQUEST URL: {url} ===")
-    print(f"=== REQUEST BODY: {body.decode('utf-8')[:500]} ===")
-
-    req = urllib.request.Request(
-        url, data=body, method="POST",
-        headers={"Content-Type": "application/x-www-form-urlencoded"},
-    )
-
-    try:
-        with urllib.request.urlopen(req, timeout=15) as resp:
-            raw = resp.read().decode("utf-8")
-            return json.loads(raw) if raw else {}
-    except urllib.error.HTTPError as e:
-        err = e.read().decode("utf-8") if e.fp else ""
-        return {"errorCode": str(e.code), "errorMessage": err}
-    except Exception as e:
-        return {"errorCode": "500", "errorMessage": str(e)}
-
-
 def parse_body(event):
     raw = event.get("body", "{}")
     if isinstance(raw, dict):
@@ -62,30 +31,18 @@ def parse_body(event):
     return {}
 
 
-def handler(event, context):
-    """Регистрация заказа в Альфа-Банке и получение ссылки на оплату"""
-    if event.get("httpMethod") == "OPTIONS":
-        return {"statusCode": 200, "headers": CORS_HEADERS, "body": ""}
-
-    if event.get("httpMethod") != "POST":
-        return {"statusCode": 405, "headers": CORS_HEADERS, "body": json.dumps({"error": "Method not allowed"})}
-
-    body = parse_body(event)
-    nominal = body.get("nominal", 0)
-    recipient_name = body.get("recipientName", "").strip()
-    sender_name = body.get("senderName", "").strip()
-    return_url = body.get("returnUrl", "").strip()
-
-    if not nominal or nominal < 500:
-        return {"statusCode": 400, "headers": CORS_HEADERS, "body": json.dumps({"error": "Минимальная сумма 500 ₽"})}
-
-    if not recipient_name:
-        return {"statusCode": 400, "headers": CORS_HEADERS, "body": json.dumps({"error": "Укажите имя получателя"})}
+def unavailable(result):
+    """Цепь к Альфа-Банку разомкнута: быстрый ответ 503, который клиент может повторить"""
+    retry_after = result.get("retryAfter", 1)
+    return {
+        "statusCode": 503,
+        "headers": dict(CORS_HEADERS, **{"Retry-After": str(retry_after)}),
+        "body": json.dumps({"error": result.get("errorMessage", ""), "retryable": True, "retryAfter": retry_after}),
+    }
 
-    if not return_url:
-        return {"statusCode": 400, "headers": CORS_HEADERS, "body": json.dumps({"error": "returnUrl обязателен"})}
 
-    order_number = f"SG-{uuid.uuid4().hex[:12]}"
+def register_order(nominal, recipient_name, sender_name, return_url):
+    order_number = f"SG-{os.urandom(6).hex()}"
     amount_kopecks = int(nominal * 100)
 
     description = f"Подарочный сертификат Sweep GIFT на {nominal} руб."
@@ -106,8 +63,11 @@ def handler(event, context):
         "jsonParams": order_params,
     })
 
-    print(f"=== register.do order={order_number} amount={amount_kopecks} ===")
-    print(json.dumps(result, ensure_ascii=False))
+    log.info("alfa.register", orderNumber=order_number, amount=amount_kopecks, orderId=result.get("orderId"), errorCode=result.get("errorCode"))
+    log.debug("alfa.register response", response=result)
+
+    if result.get("circuitOpen"):
+        return unavailable(result)
 
     if result.get("errorCode") and result["errorCode"] != "0":
         return {
@@ -124,4 +84,60 @@ def handler(event, context):
             "formUrl": result.get("formUrl", ""),
             "orderNumber": order_number,
         }),
-    }
\ No newline at end of file
+    }
+
+
+@instrumented("create-payment")
+@profiled("create-payment")
+def handler(event, context):
+    """Регистрация заказа в Альфа-Банке и получение ссылки на оплату"""
+    if event.get("httpMethod") == "OPTIONS":
+        return {"statusCode": 200, "headers": CORS_HEADERS, "body": ""}
+
+    if event.get("httpMethod") != "POST":
+        return {"statusCode": 405, "headers": CORS_HEADERS, "body": json.dumps({"error": "Method not allowed"})}
+
+    body = parse_body(event)
+    nominal = body.get("nominal", 0)
+    recipient_name = body.get("recipientName", "").strip()
+    sender_name = body.get("senderName", "").strip()
+    return_url = body.get("returnUrl", "").strip()
+
+    if not nominal or nominal < 500:
+        return {"statusCode": 400, "headers": CORS_HEADERS, "body": json.dumps({"error": "Минимальная сумма 500 ₽"})}
+
+    if not recipient_name:
+        return {"statusCode": 400, "headers": CORS_HEADERS, "body": json.dumps({"error": "Укажите имя получателя"})}
+
+    if not return_url:
+        return {"statusCode": 400, "headers": CORS_HEADERS, "body": json.dumps({"error": "returnUrl обязателен"})}
+
+    payload = {"nominal": nominal, "recipientName": recipient_name, "senderName": sender_name, "returnUrl": return_url}
+    key = request_key("create-payment", event, body, payload)
+    if key is None:
+        return register_order(nominal, recipient_name, sender_name, return_url)
+
+    # Повторная отправка формы и двойной клик получают уже зарегистрированный заказ, а не новый
+    store = IdempotencyStore()
+    payload_fingerprint = fingerprint(payload)
+
+    def replay():
+        stored = store.get(key)
+        if stored is None:
+            return None
+        stored_fingerprint, response = stored
+        if stored_fingerprint != payload_fingerprint:
+            return {
+                "statusCode": 409,
+                "headers": CORS_HEADERS,
+                "body": json.dumps({"error": "Ключ идемпотентности уже использован для другого платежа"}),
+            }
+        return {"statusCode": 200, "headers": dict(CORS_HEADERS, **{"Idempotent-Replayed": "true"}), "body": json.dumps(response)}
+
+    def register():
+        response = register_order(nominal, recipient_name, sender_name, return_url)
+        if response["statusCode"] == 200:
+            store.save(key, payload_fingerprint, json.loads(response["body"]))
+        return response
+
+    return replay() or singleflight.run(key, register, ready=replay)
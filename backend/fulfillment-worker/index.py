@@ -0,0 +1,63 @@
+"""Фоновый выпуск сертификатов из очереди outbox"""
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from shared.metrics import instrumented
+from shared import card_pool, log
+from shared.outbox import Outbox, drain
+from shared.reconciliation import reconcile
+from shared.storage import require_shared
+
+RUN_SECONDS = float(os.environ.get("WORKER_RUN_SECONDS", "50"))
+
+HEADERS = {"Content-Type": "application/json"}
+
+
+@instrumented("fulfillment-worker")
+def handler(event, context):
+    """GET — глубина очереди и пула карт; POST или вызов по таймеру — обработка очереди и пополнение пула,
+    action=reconcile — сверка оплаченных заказов Альфа-Банка с выпущенными сертификатами"""
+    method = event.get("httpMethod")
+
+    if method == "GET":
+        return {
+            "statusCode": 200,
+            "headers": HEADERS,
+            "body": json.dumps({"queue": Outbox().depth(), "cardPool": card_pool.CardPool().available()}),
+        }
+
+    if method not in (None, "POST"):
+        return {"statusCode": 405, "headers": HEADERS, "body": json.dumps({"error": "Method not allowed"})}
+
+    try:
+        # Очередь этого контейнера пуста: без общей базы воркер обрабатывал бы свою копию, а не заказы функций
+        require_shared("обработка очереди выпуска")
+    except RuntimeError as e:
+        log.error("worker.no_shared_store", error=str(e))
+        return {"statusCode": 500, "headers": HEADERS, "body": json.dumps({"error": str(e)})}
+
+    started = time.time()
+    action = (event.get("queryStringParameters") or {}).get("action") or event.get("action")
+    if action == "reconcile":
+        run = reconcile(deadline=started + RUN_SECONDS)
+        return {
+            "statusCode": 200,
+            "headers": HEADERS,
+            "body": json.dumps({"reconcile": run, "queue": Outbox().depth(), "elapsed": round(time.time() - started, 3)}),
+        }
+
+    processed = drain(deadline=started + RUN_SECONDS)
+    replenished = card_pool.replenish() if card_pool.ENABLED else 0
+    return {
+        "statusCode": 200,
+        "headers": HEADERS,
+        "body": json.dumps({
+            "processed": processed,
+            "queue": Outbox().depth(),
+            "cardPool": {"added": replenished, "available": card_pool.CardPool().available()},
+            "elapsed": round(time.time() - started, 3),
+        }),
+    }
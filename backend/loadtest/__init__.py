@@ -0,0 +1 @@
+"""Нагрузочное тестирование backend-функций на локальных заглушках"""
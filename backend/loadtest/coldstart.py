@@ -0,0 +1,140 @@
+"""Цена холодного старта функций: импорт index.py, первый и тёплый запрос в свежем интерпретаторе
+
+Пример:
+    python backend/loadtest/coldstart.py --runs 7 --out cold.json --baseline cold-main.json
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+BACKEND = os.path.dirname(HERE)
+sys.path.insert(0, BACKEND)
+
+from loadtest.run import git_revision, get, post  # noqa: E402
+from loadtest.stubs import Fault, start_stubs  # noqa: E402
+
+# Функция и типичный первый запрос после простоя
+FIRST_REQUESTS = {
+    "create-payment": post({
+        "nominal": 1000, "recipientName": "Холодный Старт", "senderName": "", "returnUrl": "https://example.com/return",
+    }),
+    "check-payment": post({"orderId": "coldstart-1"}),
+    "create-certificate": post({"recipientName": "Холодный Старт", "nominal": 1000}),
+    "payment-callback": get(mdOrder="coldstart-2", operation="approved", status="1"),
+    "fulfillment-worker": get(),
+    "render-certificate": get(format="gif"),
+}
+
+# Выполняется в отдельном интерпретаторе: как платформа после простоя
+CHILD = r"""
+import importlib.util, json, os, sys, time
+started = time.perf_counter()
+modules_before = len(sys.modules)
+path = os.path.join(sys.argv[1], sys.argv[2], "index.py")
+spec = importlib.util.spec_from_file_location("index", path)
+module = importlib.util.module_from_spec(spec)
+out, sys.stdout = sys.stdout, open(os.devnull, "w")
+spec.loader.exec_module(module)
+imported = time.perf_counter()
+event = json.loads(sys.argv[3])
+module.handler(dict(event), None)
+first = time.perf_counter()
+module.handler(dict(event), None)
+warm = time.perf_counter()
+out.write(json.dumps({
+    "importMs": (imported - started) * 1000,
+    "firstMs": (first - imported) * 1000,
+    "coldMs": (first - started) * 1000,
+    "warmMs": (warm - first) * 1000,
+    "modules": len(sys.modules) - modules_before,
+}) + "\n")
+"""
+
+METRICS = ("importMs", "firstMs", "coldMs", "warmMs")
+
+
+def measure(function_name, event, runs, env):
+    samples = []
+    for _ in range(runs):
+        env = dict(env, SWEEP_DB_PATH=os.path.join(tempfile.mkdtemp(prefix="sweep-coldstart-"), "sweep.sqlite3"))
+        output = subprocess.check_output(
+            [sys.executable, "-c", CHILD, BACKEND, function_name, json.dumps(event, ensure_ascii=False)],
+            env=env, text=True,
+        )
+        samples.append(json.loads(output.strip().splitlines()[-1]))
+    result = {key: round(statistics.median(s[key] for s in samples), 2) for key in METRICS}
+    result["modules"] = samples[-1]["modules"]
+    return result
+
+
+def compare(report, baseline, max_regression, out=sys.stdout):
+    """Печатает изменения к baseline; True, если холодный старт (импорт + первый запрос) какой-то функции
+    ухудшился сильнее порога. Перенос импорта из старта в первый запрос регрессией не считается"""
+    regressed = False
+    for function_name, result in report["functions"].items():
+        old = baseline["functions"].get(function_name)
+        if not old:
+            continue
+        for key in METRICS:
+            if not old.get(key):
+                continue
+            change = (result[key] - old[key]) / old[key]
+            print(f"  {function_name:20s} {key:9s} {old[key]:>9} -> {result[key]:<9} ({change:+.1%})", file=out)
+            if key == "coldMs" and change > max_regression:
+                regressed = True
+    return regressed
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--function", action="append", choices=sorted(FIRST_REQUESTS), help="по умолчанию все")
+    parser.add_argument("--runs", type=int, default=5, help="запусков на функцию, в отчёте медиана")
+    parser.add_argument("--latency-ms", type=float, default=0.0)
+    parser.add_argument("--out", help="сохранить отчёт в JSON")
+    parser.add_argument("--baseline", help="сравнить с ранее сохранённым отчётом")
+    parser.add_argument("--max-regression", type=float, default=0.2, help="допустимое ухудшение холодного старта")
+    args = parser.parse_args(argv)
+
+    alfa, primehill = start_stubs(Fault(args.latency_ms, 0.0, 0.0))
+    env = dict(
+        os.environ,
+        ALFA_API_URL=alfa.url,
+        PRIME_HILL_API_URL=primehill.url,
+        ALFA_MERCHANT_TOKEN="coldstart",
+        PRIME_HILL_API_KEY="coldstart",
+    )
+    try:
+        functions = {
+            function_name: measure(function_name, FIRST_REQUESTS[function_name], args.runs, env)
+            for function_name in (args.function or sorted(FIRST_REQUESTS))
+        }
+    finally:
+        alfa.stop()
+        primehill.stop()
+
+    report = {"revision": git_revision(), "runs": args.runs, "latencyMs": args.latency_ms, "functions": functions}
+    print(f"{'function':20s} {'import ms':>10} {'first ms':>10} {'cold ms':>10} {'warm ms':>10} {'modules':>8}")
+    for function_name, r in functions.items():
+        print(f"{function_name:20s} {r['importMs']:>10} {r['firstMs']:>10} {r['coldMs']:>10} {r['warmMs']:>10} {r['modules']:>8}")
+
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        print(f"vs baseline {baseline.get('revision', '')}:")
+        if compare(report, baseline, args.max_regression):
+            print("REGRESSION")
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
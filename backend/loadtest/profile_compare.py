@@ -0,0 +1,94 @@
+"""Сравнение профилей handler из shared/profiling.py: время по функциям и аллокации по строкам
+
+Пример:
+    python backend/loadtest/profile_compare.py /tmp/profiles-main /tmp/sweep_profiles --fn create-certificate
+"""
+import argparse
+import glob
+import json
+import os
+import statistics
+import sys
+
+
+def load(path, function_name=None):
+    """Артефакты из файла или каталога, по желанию только одной функции"""
+    paths = sorted(glob.glob(os.path.join(path, "*.json"))) if os.path.isdir(path) else [path]
+    artifacts = []
+    for artifact_path in paths:
+        with open(artifact_path) as f:
+            artifact = json.load(f)
+        if function_name is None or artifact["fn"] == function_name:
+            artifacts.append(artifact)
+    return artifacts
+
+
+def aggregate(artifacts):
+    """Медианы по прогонам; строка, которой нет в топе прогона, считается нулевой"""
+    runs = len(artifacts)
+
+    def median(values):
+        return round(statistics.median(values + [0.0] * (runs - len(values))), 3)
+
+    cpu, alloc = {}, {}
+    for artifact in artifacts:
+        for row in artifact["cpu"]:
+            entry = cpu.setdefault(row["f"], {"selfMs": [], "cumMs": []})
+            entry["selfMs"].append(row["selfMs"])
+            entry["cumMs"].append(row["cumMs"])
+        for row in artifact["alloc"]:
+            alloc.setdefault(row["at"], []).append(row["kb"])
+    return {
+        "runs": runs,
+        "ms": median([a["ms"] for a in artifacts]),
+        "peakKb": median([a["peakKb"] for a in artifacts]),
+        "cpu": {name: {key: median(values) for key, values in entry.items()} for name, entry in cpu.items()},
+        "alloc": {at: median(values) for at, values in alloc.items()},
+    }
+
+
+def changes(old, new, top):
+    """Строки с наибольшим абсолютным изменением"""
+    rows = [(name, old.get(name, 0.0), new.get(name, 0.0)) for name in set(old) | set(new)]
+    rows.sort(key=lambda row: abs(row[2] - row[1]), reverse=True)
+    return rows[:top]
+
+
+def compare(base, head, top, out=sys.stdout):
+    print(f"runs: {base['runs']} -> {head['runs']}", file=out)
+    print(f"handler ms: {base['ms']} -> {head['ms']} ({head['ms'] - base['ms']:+.2f})", file=out)
+    print(f"peak kb:    {base['peakKb']} -> {head['peakKb']} ({head['peakKb'] - base['peakKb']:+.1f})", file=out)
+    for key in ("selfMs", "cumMs"):
+        print(f"\n{key}:", file=out)
+        old = {name: entry[key] for name, entry in base["cpu"].items()}
+        new = {name: entry[key] for name, entry in head["cpu"].items()}
+        for name, before, after in changes(old, new, top):
+            print(f"  {after - before:+10.3f}  {before:>10} -> {after:<10} {name}", file=out)
+    print("\nalloc kb:", file=out)
+    for at, before, after in changes(base["alloc"], head["alloc"], top):
+        print(f"  {after - before:+10.1f}  {before:>10} -> {after:<10} {at}", file=out)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("base", help="артефакт или каталог артефактов до изменения")
+    parser.add_argument("head", help="артефакт или каталог артефактов после изменения")
+    parser.add_argument("--fn", help="только эта функция")
+    parser.add_argument("--top", type=int, default=15)
+    parser.add_argument("--max-regression", type=float, default=0.2, help="допустимое ухудшение времени handler")
+    args = parser.parse_args(argv)
+
+    base, head = load(args.base, args.fn), load(args.head, args.fn)
+    if not base or not head:
+        print("нет артефактов для сравнения")
+        return 2
+    base, head = aggregate(base), aggregate(head)
+    compare(base, head, args.top)
+    if base["ms"] and (head["ms"] - base["ms"]) / base["ms"] > args.max_regression:
+        print("REGRESSION")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,183 @@
+"""Нагрузочный прогон handler() функций против локальных заглушек Альфа-Банка и Prime Hill
+
+Пример:
+    python backend/loadtest/run.py --scenario check-payment --requests 500 --concurrency 16 \\
+        --latency-ms 80 --error-rate 0.01 --out bench.json --baseline bench-main.json
+"""
+import argparse
+import importlib.util
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+BACKEND = os.path.dirname(HERE)
+sys.path.insert(0, BACKEND)
+
+from loadtest.stubs import Fault, start_stubs  # noqa: E402
+
+
+def load_handler(function_name):
+    path = os.path.join(BACKEND, function_name, "index.py")
+    spec = importlib.util.spec_from_file_location(f"loadtest_{function_name.replace('-', '_')}", path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module.handler
+
+
+def post(body):
+    return {"httpMethod": "POST", "headers": {}, "body": json.dumps(body, ensure_ascii=False)}
+
+
+def get(**query):
+    return {"httpMethod": "GET", "headers": {}, "queryStringParameters": query}
+
+
+# Сценарий: функция и генератор события по номеру запроса
+SCENARIOS = {
+    "create-payment": ("create-payment", lambda i: post({
+        "nominal": 1000, "recipientName": f"Получатель {i}", "senderName": "", "returnUrl": "https://example.com/return",
+    })),
+    "check-payment": ("check-payment", lambda i: post({"orderId": f"load-{i}"})),
+    "check-payment-repeat": ("check-payment", lambda i: post({"orderId": f"load-{i % 10}"})),
+    "create-certificate": ("create-certificate", lambda i: post({"recipientName": f"Получатель {i}", "nominal": 1000})),
+    "create-certificate-bulk": ("create-certificate", lambda i: post({
+        "certificates": [{"recipientName": f"Получатель {i}-{j}", "nominal": 1000} for j in range(50)],
+    })),
+    "clients": ("create-certificate", lambda i: get(action="clients", limit="100", cursor=str(i % 10 * 100))),
+}
+
+
+def percentile(ordered, q):
+    if not ordered:
+        return 0.0
+    return ordered[min(int(q * len(ordered)), len(ordered) - 1)]
+
+
+def git_revision():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], cwd=BACKEND, text=True).strip()
+    except Exception:
+        return ""
+
+
+def run(scenario, requests, concurrency, warmup):
+    function_name, make_event = SCENARIOS[scenario]
+    handler = load_handler(function_name)
+
+    def invoke(i):
+        started = time.perf_counter()
+        try:
+            status = handler(make_event(i), None).get("statusCode", 0)
+        except Exception:
+            status = "exception"
+        return (time.perf_counter() - started) * 1000, status
+
+    for i in range(warmup):
+        invoke(requests + i)
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        results = list(pool.map(invoke, range(requests)))
+    elapsed = time.perf_counter() - started
+
+    latencies = sorted(ms for ms, _ in results)
+    statuses = {}
+    for _, status in results:
+        statuses[str(status)] = statuses.get(str(status), 0) + 1
+    return {
+        "requests": requests,
+        "elapsedS": round(elapsed, 3),
+        "throughputRps": round(requests / elapsed, 1) if elapsed else 0,
+        "p50Ms": round(percentile(latencies, 0.50), 2),
+        "p95Ms": round(percentile(latencies, 0.95), 2),
+        "p99Ms": round(percentile(latencies, 0.99), 2),
+        "maxMs": round(latencies[-1], 2) if latencies else 0,
+        "statuses": statuses,
+    }
+
+
+def compare(report, baseline, max_regression, out=sys.stdout):
+    """Печатает изменения к baseline; True, если p95 или пропускная способность ухудшились сильнее порога"""
+    regressed = False
+    for key, higher_is_worse in (("p50Ms", True), ("p95Ms", True), ("p99Ms", True), ("throughputRps", False)):
+        old, new = baseline["result"].get(key), report["result"].get(key)
+        if not old:
+            continue
+        change = (new - old) / old
+        print(f"  {key:14s} {old:>10} -> {new:<10} ({change:+.1%})", file=out)
+        worse = change if higher_is_worse else -change
+        if key in ("p95Ms", "throughputRps") and worse > max_regression:
+            regressed = True
+    return regressed
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--scenario", choices=sorted(SCENARIOS), default="check-payment")
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--warmup", type=int, default=5)
+    parser.add_argument("--latency-ms", type=float, default=50.0)
+    parser.add_argument("--jitter-ms", type=float, default=10.0)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--client-base", type=int, default=1000, help="размер ответа getClients в заглушке")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--out", help="сохранить отчёт в JSON")
+    parser.add_argument("--baseline", help="сравнить с ранее сохранённым отчётом")
+    parser.add_argument("--max-regression", type=float, default=0.2, help="допустимое ухудшение p95/throughput")
+    args = parser.parse_args(argv)
+
+    fault = Fault(args.latency_ms, args.jitter_ms, args.error_rate, seed=args.seed)
+    alfa, primehill = start_stubs(fault, client_base_size=args.client_base)
+    workdir = tempfile.mkdtemp(prefix="sweep-loadtest-")
+    os.environ.update({
+        "ALFA_API_URL": alfa.url,
+        "PRIME_HILL_API_URL": primehill.url,
+        "SWEEP_DB_PATH": os.path.join(workdir, "sweep.sqlite3"),
+        "ALFA_MERCHANT_TOKEN": "loadtest",
+        "PRIME_HILL_API_KEY": "loadtest",
+    })
+
+    # Логи handler и их фоновых потоков не смешиваются с отчётом
+    out = sys.stdout
+    sys.stdout = open(os.devnull, "w")
+    try:
+        result = run(args.scenario, args.requests, args.concurrency, args.warmup)
+    finally:
+        alfa.stop()
+        primehill.stop()
+
+    report = {
+        "scenario": args.scenario,
+        "revision": git_revision(),
+        "config": {
+            "requests": args.requests, "concurrency": args.concurrency, "latencyMs": args.latency_ms,
+            "jitterMs": args.jitter_ms, "errorRate": args.error_rate, "clientBase": args.client_base, "seed": args.seed,
+        },
+        "result": result,
+        "upstreamCalls": {"alfa": alfa.counts, "primehill": primehill.counts},
+    }
+    print(json.dumps(report, ensure_ascii=False, indent=2), file=out)
+
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)
+        if baseline.get("config") != report["config"]:
+            print("warning: baseline was recorded with a different config", file=sys.stderr)
+        print(f"vs {baseline.get('revision') or args.baseline}:", file=out)
+        if compare(report, baseline, args.max_regression, out):
+            print("regression above threshold", file=sys.stderr)
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
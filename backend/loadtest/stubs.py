@@ -0,0 +1,184 @@
+"""Локальные заглушки Альфа-Банка и Prime Hill с настраиваемой задержкой и ошибками"""
+import itertools
+import json
+import random
+import threading
+import time
+import urllib.parse
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class Fault:
+    """Задержка (среднее и разброс, мс) и доля ответов 500 для заглушки"""
+
+    def __init__(self, latency_ms=0.0, jitter_ms=0.0, error_rate=0.0, seed=None):
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.error_rate = error_rate
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+
+    def apply(self):
+        with self.lock:
+            delay = max(self.latency_ms + self.random.uniform(-self.jitter_ms, self.jitter_ms), 0)
+            fail = self.random.random() < self.error_rate
+        if delay:
+            time.sleep(delay / 1000)
+        return fail
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+    routes = {}
+
+    def log_message(self, *args):
+        pass
+
+    def _reply(self, status, payload):
+        body = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _dispatch(self):
+        parts = urllib.parse.urlsplit(self.path)
+        endpoint = parts.path.rstrip("/").rsplit("/", 1)[-1]
+        length = int(self.headers.get("Content-Length") or 0)
+        raw = self.rfile.read(length) if length else b""
+        route = self.routes.get(endpoint)
+        if route is None:
+            self._reply(404, {"error": f"unknown endpoint {endpoint}"})
+            return
+        if self.server.fault.apply():
+            self._reply(500, {"error": "injected failure"})
+            return
+        query = dict(urllib.parse.parse_qsl(parts.query))
+        with self.server.lock:
+            self.server.counts[endpoint] = self.server.counts.get(endpoint, 0) + 1
+        self._reply(200, route(self.server, query, raw))
+
+    do_GET = _dispatch
+    do_POST = _dispatch
+
+
+class StubServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, handler_cls, fault=None):
+        super().__init__(("127.0.0.1", 0), handler_cls)
+        self.fault = fault or Fault()
+        self.counts = {}
+        self.lock = threading.Lock()
+        self.ids = itertools.count(1)
+        self.orders = {}
+        self.thread = threading.Thread(target=self.serve_forever, daemon=True)
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self.server_port}"
+
+    def start(self):
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+
+def _form(raw):
+    return dict(urllib.parse.parse_qsl(raw.decode("utf-8")))
+
+
+def alfa_register(server, query, raw):
+    params = _form(raw)
+    order_id = f"stub-{next(server.ids)}"
+    server.orders[order_id] = params
+    return {"orderId": order_id, "formUrl": f"{server.url}/pay/{order_id}"}
+
+
+def alfa_order_status(server, query, raw):
+    order_id = _form(raw).get("orderId", "")
+    params = server.orders.get(order_id) or {
+        "jsonParams": json.dumps({"recipientName": "Нагрузочный Тест", "senderName": "", "nominal": 1000}),
+        "amount": "100000",
+    }
+    return {
+        "orderStatus": 2,
+        "actionCode": 0,
+        "amount": int(params.get("amount", 100000)),
+        "orderNumber": params.get("orderNumber", order_id),
+        "merchantOrderParams": [{"name": "jsonParams", "value": params.get("jsonParams", "{}")}],
+    }
+
+
+def alfa_last_orders(server, query, raw):
+    params = _form(raw)
+    size = int(params.get("size", 200))
+    page = int(params.get("page", 0))
+    order_ids = sorted(server.orders)
+    statuses = []
+    for order_id in order_ids[page * size:(page + 1) * size]:
+        status = alfa_order_status(server, query, f"orderId={order_id}".encode("utf-8"))
+        status["attributes"] = [{"name": "mdOrder", "value": order_id}]
+        statuses.append(status)
+    return {"errorCode": "0", "orderStatuses": statuses, "totalCount": len(order_ids), "page": page, "pageSize": size}
+
+
+class AlfaHandler(StubHandler):
+    routes = {
+        "register.do": alfa_register,
+        "getOrderStatusExtended.do": alfa_order_status,
+        "getLastOrdersForMerchants.do": alfa_last_orders,
+    }
+
+
+def ph_create_clients(server, query, raw):
+    clients = json.loads(raw or b"{}").get("clients", [])
+    response = []
+    for client in clients:
+        client_id = next(server.ids)
+        response.append({
+            "clientId": client_id,
+            "phone": client.get("phone", ""),
+            "cardNumber": str(7000000000 + client_id),
+            "cardBarcode": str(7000000000 + client_id),
+            "hash": f"stub{client_id:08d}",
+            "comment": client.get("comment", ""),
+        })
+    return {"response": response, "errors": []}
+
+
+def ph_get_clients(server, query, raw):
+    size = int(getattr(server, "client_base_size", 1000))
+    clients = (
+        {"clientId": i, "cardNumber": str(7000000000 + i), "hash": f"stub{i:08d}", "balance": 1000, "comment": "stub"}
+        for i in range(size)
+    )
+    filters = {key: query[key] for key in ("clientId", "cardNumber", "hash") if key in query}
+    return {"response": [
+        client for client in clients
+        if all(str(client[key]) == value for key, value in filters.items())
+    ]}
+
+
+class PrimeHillHandler(StubHandler):
+    routes = {
+        "ping": lambda server, query, raw: {"status": "ok"},
+        "getTemplates": lambda server, query, raw: {"response": [{"id": 15852, "name": "stub"}]},
+        "createClients": ph_create_clients,
+        "getClients": ph_get_clients,
+        "createOrder": lambda server, query, raw: {"response": {"status": "ok"}},
+        "updateClient": lambda server, query, raw: {"response": {"status": "ok"}},
+    }
+
+
+def start_stubs(fault=None, client_base_size=1000):
+    """Поднимает обе заглушки; возвращает (alfa, primehill)"""
+    alfa = StubServer(AlfaHandler, fault).start()
+    primehill = StubServer(PrimeHillHandler, fault)
+    primehill.client_base_size = client_base_size
+    return alfa, primehill.start()
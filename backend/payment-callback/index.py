@@ -0,0 +1,93 @@
+"""Callback-уведомления Альфа-Банка об оплате: выпуск сертификата без участия браузера"""
+import hashlib
+import hmac
+import json
+import os
+import sys
+import urllib.parse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from shared import log
+from shared.alfa import alfa_request
+from shared.fulfillment import is_paid, order_payload
+from shared.metrics import instrumented
+from shared.outbox import Outbox, process
+from shared.storage import FulfillmentStore, require_shared
+
+CALLBACK_SECRET = os.environ.get("ALFA_CALLBACK_SECRET", "")
+
+HEADERS = {"Content-Type": "application/json"}
+
+
+def parse_params(event):
+    params = dict(event.get("queryStringParameters") or {})
+    raw = event.get("body") or ""
+    if isinstance(raw, dict):
+        params.update(raw)
+    elif isinstance(raw, str) and raw.strip():
+        params.update(dict(urllib.parse.parse_qsl(raw)))
+    return params
+
+
+def verify_checksum(params, secret):
+    """HMAC-SHA256 от строки key1;value1;key2;value2; по всем параметрам, кроме checksum и sign_alias"""
+    checksum = params.get("checksum", "")
+    if not checksum or not secret:
+        return False
+    signed = "".join(
+        f"{key};{params[key]};"
+        for key in sorted(params)
+        if key not in ("checksum", "sign_alias")
+    )
+    expected = hmac.new(secret.encode("utf-8"), signed.encode("utf-8"), hashlib.sha256).hexdigest()
+    return hmac.compare_digest(expected.upper(), checksum.upper())
+
+
+@instrumented("payment-callback")
+def handler(event, context):
+    """Приём уведомления Альфа-Банка: проверка подписи и однократный выпуск сертификата"""
+    if event.get("httpMethod") not in ("GET", "POST"):
+        return {"statusCode": 405, "headers": HEADERS, "body": json.dumps({"error": "Method not allowed"})}
+
+    params = parse_params(event)
+    if not verify_checksum(params, CALLBACK_SECRET):
+        return {"statusCode": 403, "headers": HEADERS, "body": json.dumps({"error": "Неверная подпись уведомления"})}
+
+    try:
+        require_shared("выпуск по уведомлению")
+    except RuntimeError as e:
+        # 5xx: Альфа-Банк повторит уведомление, когда хранилище будет настроено
+        log.error("callback.no_shared_store", error=str(e))
+        return {"statusCode": 500, "headers": HEADERS, "body": json.dumps({"error": str(e)})}
+
+    order_id = params.get("mdOrder", "")
+    if params.get("operation") != "deposited" or params.get("status") != "1" or not order_id:
+        return {"statusCode": 200, "headers": HEADERS, "body": json.dumps({"ok": True, "ignored": True})}
+
+    store = FulfillmentStore()
+    if store.get(order_id):
+        return {"statusCode": 200, "headers": HEADERS, "body": json.dumps({"ok": True, "orderId": order_id})}
+
+    status_result = alfa_request("getOrderStatusExtended.do", {"orderId": order_id})
+    if status_result.get("circuitOpen") or (
+        status_result.get("errorCode") not in (None, "", "0", 0) and "orderStatus" not in status_result
+    ):
+        # Статус не получен: 5xx, чтобы Альфа-Банк повторил уведомление, а не потерял оплаченный заказ
+        log.warning("callback.status_failed", orderId=order_id, error=status_result.get("errorMessage"))
+        return {"statusCode": 502, "headers": HEADERS, "body": json.dumps({"error": "Не удалось получить статус заказа"})}
+    if not is_paid(status_result):
+        return {"statusCode": 200, "headers": HEADERS, "body": json.dumps({"ok": True, "ignored": True})}
+
+    payload = order_payload(status_result)
+    if not payload:
+        log.warning("callback.no_recipient", orderId=order_id)
+        return {"statusCode": 200, "headers": HEADERS, "body": json.dumps({"ok": False, "ignored": True})}
+
+    outbox = Outbox()
+    outbox.enqueue(order_id, payload)
+    attempts = outbox.claim_order(order_id)
+    if attempts is not None:
+        # Выпуск здесь же: callback не блокирует покупателя, а при сбое запись останется в outbox для воркера
+        process(order_id, payload, attempts)
+
+    return {"statusCode": 200, "headers": HEADERS, "body": json.dumps({"ok": True, "orderId": order_id})}
@@ -0,0 +1,127 @@
+"""Сертификат в PNG и PDF для печати и отправки по почте"""
+import base64
+import json
+import os
+import re
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from shared import log, render
+from shared.metrics import instrumented
+
+BATCH_MAX_ITEMS = int(os.environ.get("RENDER_BATCH_MAX", "1000"))
+KEY_PATTERN = re.compile(r"^[0-9a-f]{64}$")
+CONTENT_TYPES = {"png": "image/png", "pdf": "application/pdf"}
+
+CORS_HEADERS = {
+    "Access-Control-Allow-Origin": "*",
+    "Access-Control-Allow-Methods": "GET, POST, OPTIONS",
+    "Access-Control-Allow-Headers": "Content-Type, X-User-Id, X-Auth-Token, X-Session-Id",
+    "Access-Control-Max-Age": "86400",
+    "Content-Type": "application/json",
+}
+
+
+def parse_body(event):
+    raw = event.get("body", "{}")
+    if isinstance(raw, dict):
+        return raw
+    if isinstance(raw, str) and raw.strip():
+        parsed = json.loads(raw)
+        if isinstance(parsed, str):
+            parsed = json.loads(parsed)
+        return parsed if isinstance(parsed, dict) else {}
+    return {}
+
+
+def error(status, message):
+    return {"statusCode": status, "headers": CORS_HEADERS, "body": json.dumps({"error": message})}
+
+
+def validate(certificate):
+    """Текст ошибки или None; номинал приводится к числу на месте, чтобы GET и POST давали один ключ кэша"""
+    if not isinstance(certificate, dict):
+        return "Некорректная позиция"
+    if not str(certificate.get("recipientName", "")).strip():
+        return "recipientName обязателен"
+    if not str(certificate.get("cardNumber", "") or certificate.get("cardBarcode", "")):
+        return "cardNumber или cardBarcode обязателен"
+    try:
+        certificate["nominal"] = render.normalize_nominal(certificate.get("nominal", 0))
+    except (TypeError, ValueError):
+        return "nominal должен быть неотрицательным числом"
+    return None
+
+
+def file_response(key, fmt, content):
+    """Файл из кэша; хэш зависит только от содержимого, поэтому ответ можно кэшировать навсегда"""
+    return {
+        "statusCode": 200,
+        "headers": dict(CORS_HEADERS, **{
+            "Content-Type": CONTENT_TYPES[fmt],
+            "Content-Disposition": f'inline; filename="certificate-{key[:12]}.{fmt}"',
+            "Cache-Control": "public, max-age=31536000, immutable",
+            "ETag": f'"{key}"',
+        }),
+        "body": base64.b64encode(content).decode("ascii"),
+        "isBase64Encoded": True,
+    }
+
+
+@instrumented("render-certificate")
+def handler(event, context):
+    """GET ?hash=&format= — готовый файл из кэша; GET с полями сертификата — отрисовка и файл;
+    POST с сертификатом или {certificates: [...]} — отрисовка пакета, в ответе хэши для скачивания"""
+    method = event.get("httpMethod", "GET")
+
+    if method == "OPTIONS":
+        return {"statusCode": 200, "headers": CORS_HEADERS, "body": ""}
+
+    if method == "GET":
+        query = event.get("queryStringParameters") or {}
+        fmt = query.get("format", "png")
+        if fmt not in render.FORMATS:
+            return error(400, "format должен быть png или pdf")
+
+        key = query.get("hash", "")
+        if key:
+            if not KEY_PATTERN.match(key):
+                return error(400, "Некорректный hash")
+            content = render.cached(key, fmt)
+            if content is None:
+                return error(404, "Сертификат не найден, отрисуйте его через POST")
+            return file_response(key, fmt, content)
+
+        certificate = {field: query.get(field, "") for field in ("cardNumber", "cardBarcode", "recipientName", "senderName")}
+        certificate["nominal"] = query.get("nominal", 0)
+        problem = validate(certificate)
+        if problem:
+            return error(400, problem)
+        key = render.render(certificate)
+        return file_response(key, fmt, render.cached(key, fmt))
+
+    if method != "POST":
+        return error(405, "Method not allowed")
+
+    try:
+        body = parse_body(event)
+    except (json.JSONDecodeError, ValueError):
+        return error(400, "Некорректный JSON")
+
+    certificates = body["certificates"] if "certificates" in body else [body]
+    if not isinstance(certificates, list) or not certificates:
+        return error(400, "certificates должен быть непустым списком")
+    if len(certificates) > BATCH_MAX_ITEMS:
+        return error(400, f"Не больше {BATCH_MAX_ITEMS} сертификатов за запрос")
+    for index, certificate in enumerate(certificates):
+        problem = validate(certificate)
+        if problem:
+            return error(400, f"Позиция {index}: {problem}")
+
+    log.info("render.batch", count=len(certificates))
+    keys, rendered = render.render_batch(certificates)
+    items = [
+        {"hash": key, "cardNumber": str(certificate.get("cardNumber", "")), "cached": key not in rendered}
+        for key, certificate in zip(keys, certificates)
+    ]
+    return {"statusCode": 200, "headers": CORS_HEADERS, "body": json.dumps({"items": items, "formats": list(render.FORMATS)})}
@@ -0,0 +1 @@
+"""Общий код backend-функций Sweep GIFT"""
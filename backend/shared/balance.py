@@ -0,0 +1,142 @@
+"""Остаток на карте сертификата: короткий кэш по clientId, сбрасывается нашим же пополнением.
+
+Сброс виден только кэшу того процесса, где прошло пополнение (или всем функциям при PH_CACHE_DISK=1
+и общем SWEEP_DB_PATH). Пополнения в check-payment, воркере и payment-callback идут в других контейнерах,
+поэтому здесь их остаток становится виден не позже чем через BALANCE_TTL секунд. Пачка с несколькими
+промахами берёт карты из закэшированного списка getClients (CACHE_TTLS в primehill.py), поэтому
+её остатки могут быть старше — на срок жизни этого списка.
+"""
+import os
+
+from shared import metrics
+from shared.primehill import balance_key, ph_cache, ph_cached_get, ph_request
+from shared.storage import connect, ensure_schema
+
+TTL = float(os.environ.get("BALANCE_TTL", "15"))
+WORKERS = int(os.environ.get("BALANCE_WORKERS", "8"))
+LOOKUP_TYPES = ("cardNumber", "hash")
+
+
+class CardAliases:
+    """Номер карты или hash -> clientId; связь не меняется, поэтому хранится без срока"""
+
+    def __init__(self, conn=None):
+        self.conn = conn or connect()
+        ensure_schema(
+            self.conn,
+            "CREATE TABLE IF NOT EXISTS card_aliases (alias TEXT PRIMARY KEY, client_id TEXT NOT NULL)"
+        )
+
+    def resolve(self, aliases):
+        aliases = list(aliases)
+        if not aliases:
+            return {}
+        placeholders = ", ".join("?" * len(aliases))
+        rows = self.conn.execute(
+            f"SELECT alias, client_id FROM card_aliases WHERE alias IN ({placeholders})", aliases
+        ).fetchall()
+        return dict(rows)
+
+    def remember(self, client):
+        client_id = str(client.get("clientId", ""))
+        if not client_id:
+            return
+        self.conn.executemany(
+            "INSERT OR IGNORE INTO card_aliases (alias, client_id) VALUES (?, ?)",
+            [
+                (f"{lookup}:{client[field]}", client_id)
+                for lookup, field in (("cardNumber", "cardNumber"), ("hash", "hash"))
+                if client.get(field)
+            ],
+        )
+
+
+def project(client):
+    return {
+        "clientId": str(client.get("clientId", "")),
+        "cardNumber": str(client.get("cardNumber", "")),
+        "balance": client.get("balance", 0),
+    }
+
+
+def fetch(field, value):
+    """Клиент из getClients по фильтру; результат в формате ph_request, data — клиент.
+
+    Берётся только клиент, у которого поле совпадает с value: если Prime Hill не применит фильтр,
+    чужой остаток не будет ни показан, ни закреплён в card_aliases.
+    """
+    result = ph_request("GET", "getClients", params={field: value})
+    if not result.get("ok"):
+        return result
+    for client in result.get("data", {}).get("response", []):
+        if str(client.get(field, "")) == str(value):
+            return {"ok": True, "status": result["status"], "data": client}
+    return {"ok": False, "status": 404, "error": "Карта не найдена"}
+
+
+def lookup(lookup_type, value, aliases):
+    """Остаток одной карты: известный clientId — через кэш, неизвестная карта — поиском в Prime Hill"""
+    client_id = aliases.get(f"{lookup_type}:{value}")
+    if client_id is None:
+        result = fetch(lookup_type, value)
+        if not result.get("ok"):
+            return result
+        client = result["data"]
+        CardAliases().remember(client)
+        ph_cache.set(balance_key(client.get("clientId", "")), project(client), TTL)
+        return {"ok": True, "data": project(client), "cached": False}
+
+    cached = ph_cache.get(balance_key(client_id))
+    if cached is not None:
+        return {"ok": True, "data": cached[0], "cached": True}
+    result = fetch("clientId", client_id)
+    if not result.get("ok"):
+        return result
+    ph_cache.set(balance_key(client_id), project(result["data"]), TTL)
+    return {"ok": True, "data": project(result["data"]), "cached": False}
+
+
+def prefetch(unique, aliases):
+    """Промахи пачки — из одного закэшированного getClients, а не запросом на карту в лимит getClients.
+
+    Найденные карты попадают в card_aliases и кэш остатков; остальные lookup() ищет по одной.
+    """
+    misses = [
+        (lookup_type, value) for lookup_type, value in unique
+        if aliases.get(f"{lookup_type}:{value}") is None
+        or ph_cache.get(balance_key(aliases[f"{lookup_type}:{value}"])) is None
+    ]
+    if len(misses) < 2:
+        return
+    result = ph_cached_get("getClients")
+    if not result.get("ok"):
+        return
+    index = {}
+    for client in result.get("data", {}).get("response", []):
+        for field in LOOKUP_TYPES:
+            if client.get(field):
+                index[(field, str(client[field]))] = client
+    card_aliases = CardAliases()
+    for lookup_type, value in misses:
+        client = index.get((lookup_type, str(value)))
+        if client is None or not client.get("clientId"):
+            continue
+        card_aliases.remember(client)
+        aliases[f"{lookup_type}:{value}"] = str(client["clientId"])
+        ph_cache.set(balance_key(client["clientId"]), project(client), TTL)
+
+
+def balances(lookups, workers=WORKERS):
+    """Остатки пачки карт: [(тип, значение)] -> [результат]; повторы и кэш-попадания не идут в Prime Hill"""
+    unique = list(dict.fromkeys(lookups))
+    aliases = CardAliases().resolve(f"{lookup_type}:{value}" for lookup_type, value in unique)
+    prefetch(unique, aliases)
+    if len(unique) == 1:
+        results = [lookup(*unique[0], aliases)]
+    else:
+        from concurrent.futures import ThreadPoolExecutor
+
+        with ThreadPoolExecutor(max_workers=min(workers, len(unique))) as pool:
+            results = list(pool.map(metrics.propagate(lambda item: lookup(*item, aliases)), unique))
+    by_lookup = dict(zip(unique, results))
+    return [by_lookup[item] for item in lookups]
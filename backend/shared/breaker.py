@@ -0,0 +1,129 @@
+"""Circuit breaker и адаптивные таймауты для вызовов внешних API"""
+import os
+import threading
+import time
+from collections import deque
+
+from shared import http_client, metrics
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+WINDOW = int(os.environ.get("BREAKER_WINDOW", "20"))
+MIN_CALLS = int(os.environ.get("BREAKER_MIN_CALLS", "10"))
+ERROR_THRESHOLD = float(os.environ.get("BREAKER_ERROR_THRESHOLD", "0.5"))
+OPEN_SECONDS = float(os.environ.get("BREAKER_OPEN_SECONDS", "30"))
+HALF_OPEN_PROBES = int(os.environ.get("BREAKER_HALF_OPEN_PROBES", "1"))
+
+TIMEOUT_MIN = float(os.environ.get("ADAPTIVE_TIMEOUT_MIN", "2"))
+TIMEOUT_FACTOR = float(os.environ.get("ADAPTIVE_TIMEOUT_FACTOR", "3"))
+TIMEOUT_MIN_SAMPLES = 20
+
+
+class CircuitBreaker:
+    """Размыкается при доле ошибок выше порога в скользящем окне, через OPEN_SECONDS пропускает пробные запросы"""
+
+    def __init__(self, name):
+        self.name = name
+        self.state = CLOSED
+        self.results = deque(maxlen=WINDOW)
+        self.opened_at = 0.0
+        self.probes = 0
+        self.probed_at = 0.0
+        self.lock = threading.Lock()
+
+    def allow(self):
+        with self.lock:
+            if self.state == OPEN:
+                if time.time() - self.opened_at < OPEN_SECONDS:
+                    return False
+                self.state = HALF_OPEN
+                self.probes = 0
+            if self.state == HALF_OPEN:
+                # Пробный запрос, не сообщивший результат за OPEN_SECONDS, больше не держит слот
+                if self.probes >= HALF_OPEN_PROBES and time.time() - self.probed_at >= OPEN_SECONDS:
+                    self.probes = 0
+                if self.probes >= HALF_OPEN_PROBES:
+                    return False
+                self.probes += 1
+                self.probed_at = time.time()
+            return True
+
+    def release(self):
+        """Возвращает слот пробного запроса, который так и не ушёл во внешний API (например, отклонён лимитером)"""
+        with self.lock:
+            if self.state == HALF_OPEN and self.probes > 0:
+                self.probes -= 1
+
+    def is_open(self):
+        """Разомкнута ли цепь сейчас; в отличие от allow() не расходует пробные запросы"""
+        with self.lock:
+            return self.state == OPEN and time.time() - self.opened_at < OPEN_SECONDS
+
+    def record(self, success):
+        with self.lock:
+            if self.state == HALF_OPEN:
+                if success:
+                    self.state = CLOSED
+                    self.results.clear()
+                else:
+                    self._open()
+                return
+            self.results.append(success)
+            failures = self.results.count(False)
+            if len(self.results) >= MIN_CALLS and failures / len(self.results) >= ERROR_THRESHOLD:
+                self._open()
+
+    def _open(self):
+        self.state = OPEN
+        self.opened_at = time.time()
+        self.results.clear()
+
+    def retry_after(self):
+        with self.lock:
+            if self.state != OPEN:
+                return 1
+            return max(int(OPEN_SECONDS - (time.time() - self.opened_at)) + 1, 1)
+
+    def snapshot(self):
+        with self.lock:
+            return {
+                "state": self.state,
+                "calls": len(self.results),
+                "failures": self.results.count(False),
+                "openedAt": self.opened_at or None,
+            }
+
+
+_breakers = {}
+_lock = threading.Lock()
+
+
+def get(name):
+    with _lock:
+        breaker = _breakers.get(name)
+        if breaker is None:
+            breaker = _breakers[name] = CircuitBreaker(name)
+        return breaker
+
+
+def snapshot():
+    with _lock:
+        breakers = list(_breakers.values())
+    return {breaker.name: breaker.snapshot() for breaker in breakers}
+
+
+def read_timeout(metric_name, adaptive=True):
+    """Таймаут чтения из наблюдаемого p99 метода; пока замеров мало — HTTP_READ_TIMEOUT.
+
+    Изменяющим методам нужен adaptive=False: их время растёт с размером пачки, а оборванный по таймауту
+    запрос мог уже выполниться, и повтор создал бы клиентов или пополнение второй раз.
+    """
+    if not adaptive:
+        return http_client.READ_TIMEOUT
+    hist = metrics.histogram(metric_name)
+    if len(hist.samples) < TIMEOUT_MIN_SAMPLES:
+        return http_client.READ_TIMEOUT
+    p99 = hist.quantile(0.99) / 1000
+    return min(max(p99 * TIMEOUT_FACTOR, TIMEOUT_MIN), http_client.READ_TIMEOUT)
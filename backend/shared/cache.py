@@ -0,0 +1,112 @@
+"""TTL-кэш с LRU-вытеснением, stale-while-revalidate и опциональным слоем на диске"""
+import json
+import threading
+import time
+from collections import OrderedDict
+
+from shared.storage import connect, ensure_schema
+
+
+class TTLCache:
+    def __init__(self, maxsize=256, disk=False):
+        self.maxsize = maxsize
+        self.disk = disk
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+        self._refreshing = set()
+        if disk:
+            ensure_schema(
+                connect(),
+                "CREATE TABLE IF NOT EXISTS cache ("
+                "key TEXT PRIMARY KEY, "
+                "value TEXT NOT NULL, "
+                "fresh_until REAL NOT NULL, "
+                "stale_until REAL NOT NULL)"
+            )
+
+    def _get_entry(self, key):
+        with self._lock:
+            entry = self._items.get(key)
+            if entry is not None:
+                self._items.move_to_end(key)
+                return entry
+        if not self.disk:
+            return None
+        row = connect().execute(
+            "SELECT value, fresh_until, stale_until FROM cache WHERE key = ?", (key,)
+        ).fetchone()
+        if not row:
+            return None
+        entry = (json.loads(row[0]), row[1], row[2])
+        self._put_entry(key, entry)
+        return entry
+
+    def _put_entry(self, key, entry):
+        with self._lock:
+            self._items[key] = entry
+            self._items.move_to_end(key)
+            while len(self._items) > self.maxsize:
+                self._items.popitem(last=False)
+
+    def get(self, key):
+        """Значение и признак свежести; None, если записи нет или она старше stale-окна"""
+        entry = self._get_entry(key)
+        if entry is None:
+            return None
+        value, fresh_until, stale_until = entry
+        now = time.time()
+        if now >= stale_until:
+            return None
+        return value, now < fresh_until
+
+    def set(self, key, value, ttl, stale_ttl=0):
+        now = time.time()
+        entry = (value, now + ttl, now + ttl + stale_ttl)
+        self._put_entry(key, entry)
+        if self.disk:
+            connect().execute(
+                "INSERT OR REPLACE INTO cache (key, value, fresh_until, stale_until) VALUES (?, ?, ?, ?)",
+                (key, json.dumps(value, ensure_ascii=False), entry[1], entry[2]),
+            )
+
+    def invalidate(self, prefix=""):
+        with self._lock:
+            for key in [k for k in self._items if k.startswith(prefix)]:
+                del self._items[key]
+        if self.disk:
+            connect().execute("DELETE FROM cache WHERE key LIKE ? ESCAPE '\\'", (_like_prefix(prefix),))
+
+    def get_or_load(self, key, loader, ttl, stale_ttl=0, cacheable=lambda value: True):
+        """Read-through: свежее значение из кэша, устаревшее — сразу с фоновым обновлением, иначе loader()"""
+        cached = self.get(key)
+        if cached is not None:
+            value, fresh = cached
+            if not fresh:
+                self._revalidate(key, loader, ttl, stale_ttl, cacheable)
+            return value
+
+        value = loader()
+        if cacheable(value):
+            self.set(key, value, ttl, stale_ttl)
+        return value
+
+    def _revalidate(self, key, loader, ttl, stale_ttl, cacheable):
+        with self._lock:
+            if key in self._refreshing:
+                return
+            self._refreshing.add(key)
+
+        def refresh():
+            try:
+                value = loader()
+                if cacheable(value):
+                    self.set(key, value, ttl, stale_ttl)
+            finally:
+                with self._lock:
+                    self._refreshing.discard(key)
+
+        threading.Thread(target=refresh, daemon=True).start()
+
+
+def _like_prefix(prefix):
+    return prefix.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_") + "%"
@@ -0,0 +1,129 @@
+"""Пул заранее созданных карт Prime Hill: выпуск сертификата без createClients на критическом пути.
+
+Пул работает только с общим SWEEP_DB_PATH: в локальной базе контейнера две функции закрепили бы
+одну и ту же карту за разными заказами.
+"""
+import os
+import threading
+import time
+
+from shared import log
+from shared.identity import allocate_phones
+from shared.primehill import build_client, ph_request
+from shared.storage import connect, ensure_schema, require_shared
+
+ENABLED = os.environ.get("CARD_POOL_ENABLED", "") == "1"
+LOW_WATERMARK = int(os.environ.get("CARD_POOL_LOW", "20"))
+HIGH_WATERMARK = int(os.environ.get("CARD_POOL_HIGH", "100"))
+REPLENISH_CHUNK = int(os.environ.get("CARD_POOL_CHUNK", "50"))
+# Метод Prime Hill для переименования карты под получателя; по умолчанию не задан — в описании API
+# такого метода нет, и карта из пула остаётся с именем резерва. Если метод задан, заказ не считается
+# выполненным, пока переименование не прошло, и повторяется через outbox
+RENAME_ENDPOINT = os.environ.get("CARD_POOL_RENAME_ENDPOINT", "")
+RENAME = bool(RENAME_ENDPOINT)
+
+AVAILABLE = "available"
+CLAIMED = "claimed"
+
+
+class CardPool:
+    def __init__(self, conn=None):
+        self.conn = conn or connect()
+        ensure_schema(
+            self.conn,
+            "CREATE TABLE IF NOT EXISTS card_pool ("
+            "client_id TEXT PRIMARY KEY, "
+            "card_number TEXT NOT NULL, "
+            "card_barcode TEXT NOT NULL, "
+            "card_hash TEXT NOT NULL, "
+            "status TEXT NOT NULL, "
+            "claimed_by TEXT, "
+            "created_at REAL NOT NULL, "
+            "claimed_at REAL)"
+        )
+        ensure_schema(self.conn, "CREATE INDEX IF NOT EXISTS card_pool_status ON card_pool (status, created_at)")
+        ensure_schema(self.conn, "CREATE UNIQUE INDEX IF NOT EXISTS card_pool_claimed_by ON card_pool (claimed_by)")
+
+    def available(self):
+        return self.conn.execute("SELECT COUNT(*) FROM card_pool WHERE status = ?", (AVAILABLE,)).fetchone()[0]
+
+    def add(self, clients):
+        now = time.time()
+        self.conn.executemany(
+            "INSERT OR IGNORE INTO card_pool (client_id, card_number, card_barcode, card_hash, status, created_at) "
+            "VALUES (?, ?, ?, ?, ?, ?)",
+            [
+                (str(c.get("clientId", "")), str(c.get("cardNumber", "")), str(c.get("cardBarcode", "")),
+                 c.get("hash", ""), AVAILABLE, now)
+                for c in clients if c.get("clientId")
+            ],
+        )
+
+    def claim(self, claimed_by):
+        """Атомарно закрепляет свободную карту за заказом; повторный вызов с тем же claimed_by вернёт ту же карту"""
+        require_shared("пул карт")
+        self.conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = self.conn.execute(
+                "SELECT client_id, card_number, card_barcode, card_hash FROM card_pool WHERE claimed_by = ?",
+                (claimed_by,),
+            ).fetchone()
+            if row is None:
+                row = self.conn.execute(
+                    "SELECT client_id, card_number, card_barcode, card_hash FROM card_pool "
+                    "WHERE status = ? ORDER BY created_at LIMIT 1",
+                    (AVAILABLE,),
+                ).fetchone()
+                if row is not None:
+                    self.conn.execute(
+                        "UPDATE card_pool SET status = ?, claimed_by = ?, claimed_at = ? WHERE client_id = ?",
+                        (CLAIMED, claimed_by, time.time(), row[0]),
+                    )
+            self.conn.execute("COMMIT")
+        except Exception:
+            self.conn.execute("ROLLBACK")
+            raise
+        if row is None:
+            return None
+        return {"clientId": row[0], "cardNumber": row[1], "cardBarcode": row[2], "hash": row[3]}
+
+
+def placeholder_client(phone):
+    client = build_client("Сертификат", "", 0, phone)
+    client["comment"] = "Резерв Sweep GIFT"
+    return client
+
+
+def replenish(low=LOW_WATERMARK, high=HIGH_WATERMARK, chunk=REPLENISH_CHUNK):
+    """Доводит пул до high, если свободных карт меньше low; возвращает число добавленных карт"""
+    require_shared("пополнение пула карт")
+    pool = CardPool()
+    available = pool.available()
+    missing = high - available if available < low else 0
+    added = 0
+    while missing > 0:
+        size = min(chunk, missing)
+        result = ph_request("POST", "createClients", data={"clients": [placeholder_client(phone) for phone in allocate_phones(size)]})
+        if not result.get("ok"):
+            log.warning("card_pool.replenish failed", status=result.get("status"), error=result.get("error"))
+            break
+        clients = result.get("data", {}).get("response", [])
+        if not clients:
+            break
+        pool.add(clients)
+        added += len(clients)
+        missing -= size
+    return added
+
+
+_background = None
+_background_lock = threading.Lock()
+
+
+def replenish_in_background():
+    global _background
+    with _background_lock:
+        if _background is not None and _background.is_alive():
+            return
+        _background = threading.Thread(target=replenish, daemon=True)
+        _background.start()
@@ -0,0 +1,179 @@
+"""Выпуск сертификата в Prime Hill по оплаченному заказу Альфа-Банка"""
+import json
+import time
+
+from shared import card_pool, log, metrics
+from shared.ledger import CertificateLedger
+from shared.primehill import build_client, build_deposit_order, gen_phone, ph_request
+from shared.storage import connect, ensure_schema
+
+STATUS_PAID = 2
+NO_RECIPIENT_ERROR = "Не удалось получить данные получателя из заказа"
+
+
+class OrderClients:
+    """Клиент Prime Hill, созданный под заказ: повторная попытка выпуска пополняет его, а не создаёт нового"""
+
+    def __init__(self, conn=None):
+        self.conn = conn or connect()
+        ensure_schema(
+            self.conn,
+            "CREATE TABLE IF NOT EXISTS order_clients ("
+            "order_id TEXT PRIMARY KEY, "
+            "client TEXT NOT NULL, "
+            "created_at REAL NOT NULL)"
+        )
+
+    def get(self, order_id):
+        row = self.conn.execute("SELECT client FROM order_clients WHERE order_id = ?", (order_id,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def save(self, order_id, client):
+        self.conn.execute(
+            "INSERT OR IGNORE INTO order_clients (order_id, client, created_at) VALUES (?, ?, ?)",
+            (order_id, json.dumps(client, ensure_ascii=False), time.time()),
+        )
+        return self.get(order_id)
+
+
+def is_paid(status_result):
+    return status_result.get("orderStatus", -1) == STATUS_PAID and status_result.get("actionCode", -1) == 0
+
+
+def order_details(status_result):
+    """Получатель, отправитель и номинал из getOrderStatusExtended"""
+    merchant_params = {}
+    json_params = status_result.get("merchantOrderParams", [])
+    for p in json_params:
+        merchant_params[p.get("name", "")] = p.get("value", "")
+
+    try:
+        order_data = json.loads(merchant_params.get("jsonParams", "{}"))
+    except Exception:
+        order_data = {}
+
+    recipient_name = order_data.get("recipientName", "")
+    sender_name = order_data.get("senderName", "")
+    nominal = order_data.get("nominal", 0)
+    amount = status_result.get("amount", 0)
+
+    if not nominal and amount:
+        nominal = amount // 100
+
+    return recipient_name, sender_name, nominal
+
+
+def order_payload(status_result):
+    """Данные для выпуска сертификата по оплаченному заказу или None, если получатель неизвестен"""
+    recipient_name, sender_name, nominal = order_details(status_result)
+    if not recipient_name:
+        return None
+    return {"recipientName": recipient_name, "senderName": sender_name, "nominal": nominal}
+
+
+def create_certificate(recipient_name, sender_name, nominal, order_ref=None):
+    """Выпуск сертификата с записью в локальный реестр"""
+    certificate, error = issue_certificate(recipient_name, sender_name, nominal, order_ref)
+    if certificate is not None:
+        CertificateLedger().record([certificate], order_id=order_ref)
+        log.info("certificate.issued", clientId=certificate["clientId"], nominal=nominal, orderId=order_ref)
+    return certificate, error
+
+
+def issue_certificate(recipient_name, sender_name, nominal, order_ref=None):
+    """Выпуск сертификата; при включённом пуле карта берётся из резерва, иначе создаётся клиент.
+
+    Повторная попытка по тому же order_ref пополняет уже созданного или закреплённого клиента тем же заказом.
+    """
+    client = OrderClients().get(order_ref) if order_ref else None
+    if client is None and order_ref and card_pool.ENABLED:
+        pool = card_pool.CardPool()
+        pooled = pool.claim(order_ref)
+        if pool.available() < card_pool.LOW_WATERMARK:
+            card_pool.replenish_in_background()
+        if pooled is not None:
+            return issue_pooled(pooled, recipient_name, sender_name, nominal, order_ref)
+
+    if client is None:
+        client, error = create_client(recipient_name, sender_name, nominal, order_ref)
+        if error:
+            return None, error
+
+    deposit_result = ph_request(
+        "POST", "createOrder", data=build_deposit_order(nominal, order_ref),
+        params={"type": "clientId", "id": str(client.get("clientId", 0))},
+    )
+    log.debug("primehill.createOrder", clientId=client.get("clientId"), response=deposit_result)
+    if not deposit_result.get("ok"):
+        log.warning("primehill.createOrder failed", clientId=client.get("clientId"), error=deposit_result.get("error"))
+        return None, "Ошибка пополнения депозита в Prime Hill"
+
+    return certificate_for(client, recipient_name, sender_name, nominal), None
+
+
+def create_client(recipient_name, sender_name, nominal, order_ref=None):
+    """createClients для одного получателя; клиент заказа запоминается до пополнения"""
+    create_result = ph_request("POST", "createClients", data={
+        "clients": [build_client(recipient_name, sender_name, nominal, gen_phone(order_ref))],
+    })
+    log.debug("primehill.createClients", response=create_result)
+
+    if not create_result.get("ok"):
+        log.warning("primehill.createClients failed", status=create_result.get("status"), error=create_result.get("error"))
+        return None, "Ошибка создания клиента в Prime Hill"
+
+    clients_list = create_result.get("data", {}).get("response", [])
+    if not clients_list:
+        return None, "Prime Hill не вернул данные клиента"
+
+    client = clients_list[0]
+    if order_ref:
+        client = OrderClients().save(order_ref, client)
+    return client, None
+
+
+def issue_pooled(client, recipient_name, sender_name, nominal, order_ref=None):
+    """Пополнение и переименование резервной карты идут параллельно: на критическом пути один запрос"""
+    from concurrent.futures import ThreadPoolExecutor
+
+    client_params = {"type": "clientId", "id": str(client["clientId"])}
+    request = metrics.propagate(ph_request)
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        deposit = executor.submit(
+            request, "POST", "createOrder", data=build_deposit_order(nominal, order_ref), params=dict(client_params),
+        )
+        rename = None
+        if card_pool.RENAME:
+            profile = build_client(recipient_name, sender_name, nominal, "")
+            rename = executor.submit(
+                request, "POST", card_pool.RENAME_ENDPOINT,
+                data={key: profile[key] for key in ("lastName", "firstName", "patronymic", "comment")},
+                params=dict(client_params),
+            )
+        deposit_result = deposit.result()
+        rename_result = rename.result() if rename else None
+
+    log.debug("primehill.createOrder", clientId=client["clientId"], pooled=True, response=deposit_result)
+    if not deposit_result.get("ok"):
+        log.warning("primehill.createOrder failed", clientId=client["clientId"], error=deposit_result.get("error"))
+        return None, "Ошибка пополнения депозита в Prime Hill"
+    # Карта с именем резерва — не выданный сертификат: заказ остаётся в очереди, повтор берёт ту же карту
+    # и тот же заказ пополнения, так что второго пополнения не будет
+    if rename_result is not None and not rename_result.get("ok"):
+        log.warning("card_pool.rename failed", clientId=client["clientId"], error=rename_result.get("error"))
+        return None, "Ошибка переименования карты из резерва в Prime Hill"
+    return certificate_for(client, recipient_name, sender_name, nominal), None
+
+
+def certificate_for(client, recipient_name, sender_name, nominal):
+    card_number = client.get("cardNumber", "")
+    return {
+        "clientId": str(client.get("clientId", 0)),
+        "cardNumber": str(card_number),
+        "cardBarcode": str(client.get("cardBarcode", "")),
+        "cardHash": client.get("hash", ""),
+        "recipientName": recipient_name,
+        "senderName": sender_name,
+        "nominal": nominal,
+        "qrUrl": str(card_number),
+    }
@@ -0,0 +1,129 @@
+"""HTTP-клиент с пулом keep-alive соединений к внешним API"""
+import os
+import threading
+import urllib.parse
+import zlib
+
+CONNECT_TIMEOUT = float(os.environ.get("HTTP_CONNECT_TIMEOUT", "5"))
+READ_TIMEOUT = float(os.environ.get("HTTP_READ_TIMEOUT", "15"))
+POOL_SIZE = int(os.environ.get("HTTP_POOL_SIZE", "8"))
+
+
+def _http():
+    """http.client тянет за собой email и ssl (десятки мс): импорт при первом запросе наружу, а не на старте,
+    чтобы CORS preflight и ответы без внешних вызовов не платили за него на холодном старте"""
+    import http.client
+
+    return http.client
+
+
+def _retryable():
+    client = _http()
+    return client.RemoteDisconnected, client.BadStatusLine, ConnectionResetError, BrokenPipeError
+
+
+class HTTPResponse:
+    def __init__(self, status, headers, body):
+        self.status = status
+        self.headers = headers
+        self.body = body
+
+    def text(self):
+        return self.body.decode("utf-8")
+
+
+class HostPool:
+    """Пул соединений к одному хосту; соединения переживают тёплые вызовы функции"""
+
+    def __init__(self, scheme, host, port, size=POOL_SIZE):
+        self.scheme = scheme
+        self.host = host
+        self.port = port
+        self.size = size
+        self._idle = []
+        self._lock = threading.Lock()
+
+    def _new_connection(self, connect_timeout):
+        client = _http()
+        cls = client.HTTPSConnection if self.scheme == "https" else client.HTTPConnection
+        conn = cls(self.host, self.port, timeout=connect_timeout)
+        conn.connect()
+        return conn
+
+    def acquire(self, connect_timeout):
+        with self._lock:
+            if self._idle:
+                return self._idle.pop(), True
+        return self._new_connection(connect_timeout), False
+
+    def release(self, conn):
+        with self._lock:
+            if len(self._idle) < self.size:
+                self._idle.append(conn)
+                return
+        conn.close()
+
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def get_pool(scheme, host, port):
+    key = (scheme, host, port)
+    pool = _pools.get(key)
+    if pool is None:
+        with _pools_lock:
+            pool = _pools.setdefault(key, HostPool(scheme, host, port))
+    return pool
+
+
+def _decode(body, encoding):
+    encoding = (encoding or "").lower()
+    if encoding == "gzip":
+        import gzip
+
+        return gzip.decompress(body)
+    if encoding == "deflate":
+        return zlib.decompress(body)
+    return body
+
+
+def request(method, url, body=None, headers=None, connect_timeout=None, read_timeout=None):
+    """Выполняет запрос через пул; сетевые ошибки пробрасываются как OSError"""
+    parts = urllib.parse.urlsplit(url)
+    port = parts.port or (443 if parts.scheme == "https" else 80)
+    path = parts.path or "/"
+    if parts.query:
+        path += "?" + parts.query
+
+    send_headers = {"Accept-Encoding": "gzip, deflate", "Connection": "keep-alive"}
+    if headers:
+        send_headers.update(headers)
+
+    pool = get_pool(parts.scheme, parts.hostname, port)
+    connect_timeout = CONNECT_TIMEOUT if connect_timeout is None else connect_timeout
+    read_timeout = READ_TIMEOUT if read_timeout is None else read_timeout
+    retryable = _retryable()
+
+    while True:
+        conn, reused = pool.acquire(connect_timeout)
+        try:
+            conn.sock.settimeout(read_timeout)
+            conn.request(method, path, body=body, headers=send_headers)
+            resp = conn.getresponse()
+            raw = resp.read()
+        except retryable:
+            conn.close()
+            if reused:
+                # сервер закрыл простаивавшее соединение — повторяем на новом
+                continue
+            raise
+        except Exception:
+            conn.close()
+            raise
+
+        if resp.will_close:
+            conn.close()
+        else:
+            pool.release(conn)
+        return HTTPResponse(resp.status, resp.headers, _decode(raw, resp.getheader("Content-Encoding")))
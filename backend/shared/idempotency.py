@@ -0,0 +1,71 @@
+"""Идемпотентные запросы: повтор с тем же ключом получает сохранённый ответ без повторного вызова внешнего API"""
+import hashlib
+import json
+import os
+import time
+
+from shared.storage import connect, ensure_schema
+
+TTL = float(os.environ.get("IDEMPOTENCY_TTL", "1200"))
+EVICT_BATCH = 100
+
+
+def fingerprint(payload):
+    return hashlib.sha256(json.dumps(payload, ensure_ascii=False, sort_keys=True).encode("utf-8")).hexdigest()
+
+
+def header(event, name):
+    name = name.lower()
+    for key, value in (event.get("headers") or {}).items():
+        if key.lower() == name:
+            return value
+    return None
+
+
+def request_key(scope, event, body, payload):
+    """Ключ из заголовка Idempotency-Key или поля idempotencyKey; без них — из X-Session-Id и данных запроса.
+    None, если ни ключа, ни сессии нет: такой запрос выполняется как обычно"""
+    explicit = header(event, "Idempotency-Key") or body.get("idempotencyKey")
+    if explicit:
+        return f"{scope}:key:{explicit}"
+    session = header(event, "X-Session-Id")
+    if session:
+        return f"{scope}:session:{session}:{fingerprint(payload)}"
+    return None
+
+
+class IdempotencyStore:
+    def __init__(self, conn=None):
+        self.conn = conn or connect()
+        ensure_schema(
+            self.conn,
+            "CREATE TABLE IF NOT EXISTS idempotency_keys ("
+            "key TEXT PRIMARY KEY, "
+            "fingerprint TEXT NOT NULL, "
+            "response TEXT NOT NULL, "
+            "expires_at REAL NOT NULL)"
+        )
+        ensure_schema(self.conn, "CREATE INDEX IF NOT EXISTS idempotency_keys_expires ON idempotency_keys (expires_at)")
+
+    def get(self, key):
+        """(fingerprint, ответ) для непросроченного ключа или None"""
+        row = self.conn.execute(
+            "SELECT fingerprint, response FROM idempotency_keys WHERE key = ? AND expires_at > ?", (key, time.time())
+        ).fetchone()
+        return (row[0], json.loads(row[1])) if row else None
+
+    def save(self, key, payload_fingerprint, response, ttl=TTL):
+        now = time.time()
+        self.conn.execute(
+            "INSERT OR REPLACE INTO idempotency_keys (key, fingerprint, response, expires_at) VALUES (?, ?, ?, ?)",
+            (key, payload_fingerprint, json.dumps(response, ensure_ascii=False), now + ttl),
+        )
+        self.evict(now)
+
+    def evict(self, now=None):
+        """Удаляет просроченные ключи небольшими порциями, чтобы запись не ждала большой чистки"""
+        self.conn.execute(
+            "DELETE FROM idempotency_keys WHERE key IN "
+            "(SELECT key FROM idempotency_keys WHERE expires_at <= ? LIMIT ?)",
+            (now or time.time(), EVICT_BATCH),
+        )
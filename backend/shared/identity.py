@@ -0,0 +1,76 @@
+"""Телефоны для новых клиентов Prime Hill без запросов к Prime Hill.
+
+Уникальность не гарантируется. Индекс allocated_phones разводит только телефоны, выданные через него
+в одной базе: без общего SWEEP_DB_PATH каждая функция ведёт свой индекс. Клиенты, созданные до индекса,
+получали случайный телефон из того же диапазона 79XXXXXXXXX и в индекс не попали, так что совпадение
+с ними возможно — с вероятностью порядка (число таких клиентов) / 10^9 на новый телефон.
+"""
+import hashlib
+import os
+import sqlite3
+import time
+
+from shared.storage import connect, ensure_schema
+
+# Телефон: 7 9 и девять цифр из хэша ref. Один ref во всех контейнерах и после редеплоя даёт один телефон,
+# разные ref расходятся по всему диапазону, а не начинают с одного и того же номера
+PHONE_SPACE = 10 ** 9
+
+
+def derive_phone(ref, attempt=0):
+    digest = hashlib.sha256(f"{ref}:{attempt}".encode("utf-8")).digest()
+    return f"79{int.from_bytes(digest[:8], 'big') % PHONE_SPACE:09d}"
+
+
+class PhoneAllocator:
+    """Индекс выданных телефонов: при совпадении хэшей ref получает следующий кандидат.
+
+    Индекс видит только выдачи в своей базе и не знает о телефонах клиентов, созданных до него.
+    """
+
+    def __init__(self, conn=None):
+        self.conn = conn or connect()
+        ensure_schema(
+            self.conn,
+            "CREATE TABLE IF NOT EXISTS allocated_phones ("
+            "phone TEXT PRIMARY KEY, "
+            "ref TEXT UNIQUE, "
+            "allocated_at REAL NOT NULL)"
+        )
+
+    def allocate(self, refs):
+        """Телефон для каждого ref одной транзакцией; повторный вызов с тем же ref вернёт тот же телефон"""
+        phones = []
+        now = time.time()
+        self.conn.execute("BEGIN IMMEDIATE")
+        try:
+            for ref in refs:
+                row = self.conn.execute("SELECT phone FROM allocated_phones WHERE ref = ?", (ref,)).fetchone()
+                if row is not None:
+                    phones.append(row[0])
+                    continue
+                attempt = 0
+                while True:
+                    phone = derive_phone(ref, attempt)
+                    try:
+                        self.conn.execute(
+                            "INSERT INTO allocated_phones (phone, ref, allocated_at) VALUES (?, ?, ?)", (phone, ref, now),
+                        )
+                        break
+                    except sqlite3.IntegrityError:
+                        attempt += 1
+                phones.append(phone)
+            self.conn.execute("COMMIT")
+        except Exception:
+            self.conn.execute("ROLLBACK")
+            raise
+        return phones
+
+
+def allocate_phone(ref=None):
+    """Телефон для заказа; без ref — для случайного ref"""
+    return PhoneAllocator().allocate([ref or os.urandom(16).hex()])[0]
+
+
+def allocate_phones(count):
+    return PhoneAllocator().allocate([os.urandom(16).hex() for _ in range(count)]) if count > 0 else []
@@ -0,0 +1,71 @@
+"""Локальный реестр выданных сертификатов: поиск для админки без запросов к Prime Hill.
+
+В реестр пишут create-certificate, check-payment, воркер и payment-callback, поэтому полным он бывает
+только в общем SWEEP_DB_PATH; поиск без него отвечает ошибкой.
+"""
+import time
+
+from shared.storage import connect, ensure_schema
+
+COLUMNS = ("client_id", "order_id", "card_number", "recipient_name", "sender_name", "nominal", "created_at")
+FIELDS = ("clientId", "orderId", "cardNumber", "recipientName", "senderName", "nominal", "createdAt")
+
+
+def normalize(name):
+    return " ".join(str(name).lower().replace("ё", "е").split())
+
+
+class CertificateLedger:
+    def __init__(self, conn=None):
+        self.conn = conn or connect()
+        ensure_schema(
+            self.conn,
+            "CREATE TABLE IF NOT EXISTS certificates ("
+            "client_id TEXT PRIMARY KEY, "
+            "order_id TEXT, "
+            "card_number TEXT NOT NULL, "
+            "recipient_name TEXT NOT NULL, "
+            "recipient_key TEXT NOT NULL, "
+            "sender_name TEXT NOT NULL, "
+            "nominal REAL NOT NULL, "
+            "created_at REAL NOT NULL)"
+        )
+        ensure_schema(self.conn, "CREATE INDEX IF NOT EXISTS certificates_card_number ON certificates (card_number)")
+        ensure_schema(self.conn, "CREATE INDEX IF NOT EXISTS certificates_order_id ON certificates (order_id)")
+        ensure_schema(self.conn, "CREATE INDEX IF NOT EXISTS certificates_recipient ON certificates (recipient_key)")
+        ensure_schema(self.conn, "CREATE INDEX IF NOT EXISTS certificates_created_at ON certificates (created_at)")
+
+    def record(self, certificates, order_id=None):
+        """Записывает выданные сертификаты; повторная запись той же карты ничего не меняет"""
+        now = time.time()
+        self.conn.executemany(
+            "INSERT OR IGNORE INTO certificates "
+            "(client_id, order_id, card_number, recipient_name, recipient_key, sender_name, nominal, created_at) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+            [
+                (str(c["clientId"]), order_id, str(c.get("cardNumber", "")), c.get("recipientName", ""),
+                 normalize(c.get("recipientName", "")), c.get("senderName", ""), c.get("nominal", 0), now)
+                for c in certificates if c.get("clientId")
+            ],
+        )
+
+    def search(self, query="", cursor=0, limit=50):
+        """Точное совпадение номера карты или заказа либо префикс имени получателя; новые сверху"""
+        where, args = "", []
+        query = query.strip()
+        if query:
+            prefix = normalize(query)
+            # Диапазон вместо LIKE: так SQLite использует индекс по recipient_key
+            where = "WHERE card_number = ? OR order_id = ? OR (recipient_key >= ? AND recipient_key < ?)"
+            args = [query, query, prefix, prefix + "￿"]
+
+        total = self.conn.execute(f"SELECT COUNT(*) FROM certificates {where}", args).fetchone()[0]
+        rows = self.conn.execute(
+            f"SELECT {', '.join(COLUMNS)} FROM certificates {where} ORDER BY created_at DESC, client_id LIMIT ? OFFSET ?",
+            args + [limit, cursor],
+        ).fetchall()
+        return [dict(zip(FIELDS, row)) for row in rows], total
+
+    def summary(self):
+        count, sold = self.conn.execute("SELECT COUNT(*), COALESCE(SUM(nominal), 0) FROM certificates").fetchone()
+        return {"count": count, "sold": sold}
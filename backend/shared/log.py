@@ -0,0 +1,108 @@
+"""Структурный лог: одна JSON-строка на событие с уровнем, функцией и идентификатором вызова.
+
+Поля с секретами маскируются, длинные значения обрезаются. Отладочные события с полными ответами
+внешних API пишутся только при LOG_LEVEL=debug или в доле вызовов LOG_DEBUG_SAMPLE; в остальных
+случаях debug() возвращается до сериализации, а значения-функции не вызываются вовсе.
+"""
+import contextvars
+import json
+import os
+import random
+import sys
+import time
+
+LEVELS = {"debug": 10, "info": 20, "warning": 30, "error": 40}
+LEVEL = LEVELS.get(os.environ.get("LOG_LEVEL", "info").lower(), LEVELS["info"])
+# Доля вызовов, в которых пишутся debug-события при уровне выше debug
+DEBUG_SAMPLE = float(os.environ.get("LOG_DEBUG_SAMPLE", "0"))
+MAX_FIELD_CHARS = int(os.environ.get("LOG_MAX_FIELD_CHARS", "2000"))
+REDACTED = "***"
+# Сравнение без учёта регистра и символов - и _
+SECRET_FIELDS = frozenset((
+    "password", "token", "username", "apikey", "xapikey", "authorization", "secret", "checksum",
+))
+
+# Контекст вызова; в пулы потоков его переносит metrics.propagate. Фоновые потоки без него пишут
+# имя функции контейнера и rid=None, а не идентификатор чужого вызова
+_context = contextvars.ContextVar("log_context", default=None)
+_process = {"fn": None, "rid": None, "debug": LEVEL <= LEVELS["debug"]}
+
+
+def bind(fn, event=None, context=None):
+    """Начинает вызов функции: идентификатор из X-Request-Id, контекста платформы или случайный"""
+    headers = {key.lower(): value for key, value in ((event or {}).get("headers") or {}).items()}
+    rid = headers.get("x-request-id") or getattr(context, "request_id", None) or os.urandom(8).hex()
+    sampled = LEVEL <= LEVELS["debug"] or (DEBUG_SAMPLE > 0 and random.random() < DEBUG_SAMPLE)
+    _context.set({"fn": fn, "rid": rid, "debug": sampled})
+    _process["fn"] = fn
+    return rid
+
+
+def current():
+    return _context.get() or _process
+
+
+def request_id():
+    return current()["rid"]
+
+
+def redact(value):
+    if isinstance(value, dict):
+        return {
+            key: REDACTED if str(key).lower().replace("-", "").replace("_", "") in SECRET_FIELDS else redact(item)
+            for key, item in value.items()
+        }
+    if isinstance(value, (list, tuple)):
+        return [redact(item) for item in value]
+    return value
+
+
+def _field(value):
+    if callable(value):
+        value = value()
+    value = redact(value)
+    if isinstance(value, str):
+        text = value
+    elif isinstance(value, (dict, list)):
+        text = json.dumps(value, ensure_ascii=False, separators=(",", ":"), default=str)
+        if len(text) <= MAX_FIELD_CHARS:
+            return value
+    else:
+        return value
+    if len(text) <= MAX_FIELD_CHARS:
+        return text
+    return f"{text[:MAX_FIELD_CHARS]}…(+{len(text) - MAX_FIELD_CHARS})"
+
+
+def enabled(level):
+    if level == "debug":
+        return current()["debug"]
+    return LEVELS[level] >= LEVEL
+
+
+def emit(level, event, fields):
+    context = current()
+    record = {"ts": round(time.time(), 3), "level": level, "event": event, "fn": context["fn"], "rid": context["rid"]}
+    for key, value in fields.items():
+        record[key] = _field(value)
+    sys.stdout.write(json.dumps(record, ensure_ascii=False, separators=(",", ":"), default=str) + "\n")
+
+
+def debug(event, **fields):
+    """Полные payload и ответы: значения-функции вычисляются, только если событие будет записано"""
+    if current()["debug"]:
+        emit("debug", event, fields)
+
+
+def info(event, **fields):
+    if LEVELS["info"] >= LEVEL:
+        emit("info", event, fields)
+
+
+def warning(event, **fields):
+    if LEVELS["warning"] >= LEVEL:
+        emit("warning", event, fields)
+
+
+def error(event, **fields):
+    emit("error", event, fields)
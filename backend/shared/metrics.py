@@ -0,0 +1,143 @@
+"""Задержки вызовов внешних API: гистограммы, Server-Timing и строка метрик на вызов функции"""
+import contextvars
+import functools
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+from shared import log
+
+BUCKETS_MS = (5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000, 15000)
+SAMPLES = 200
+
+
+class Histogram:
+    def __init__(self):
+        self.counts = [0] * (len(BUCKETS_MS) + 1)
+        self.count = 0
+        self.total_ms = 0.0
+        self.statuses = {}
+        self.bytes_out = 0
+        self.bytes_in = 0
+        self.samples = deque(maxlen=SAMPLES)
+
+    def observe(self, duration_ms, status, bytes_out, bytes_in):
+        index = 0
+        while index < len(BUCKETS_MS) and duration_ms > BUCKETS_MS[index]:
+            index += 1
+        self.counts[index] += 1
+        self.count += 1
+        self.total_ms += duration_ms
+        self.statuses[status] = self.statuses.get(status, 0) + 1
+        self.bytes_out += bytes_out
+        self.bytes_in += bytes_in
+        self.samples.append(duration_ms)
+
+    def quantile(self, q):
+        if not self.samples:
+            return None
+        ordered = sorted(self.samples)
+        return ordered[min(int(q * len(ordered)), len(ordered) - 1)]
+
+    def snapshot(self):
+        return {
+            "count": self.count,
+            "avgMs": round(self.total_ms / self.count, 1) if self.count else 0,
+            "p50Ms": self.quantile(0.5),
+            "p99Ms": self.quantile(0.99),
+            "buckets": dict(zip([str(b) for b in BUCKETS_MS] + ["inf"], self.counts)),
+            "statuses": {str(k): v for k, v in self.statuses.items()},
+            "bytesOut": self.bytes_out,
+            "bytesIn": self.bytes_in,
+        }
+
+
+_lock = threading.Lock()
+_histograms = {}
+# Вызовы внешних API текущего вызова handler. Свой список у каждого вызова: фоновые потоки и параллельные
+# handler в одном процессе не попадают в чужой Server-Timing
+_calls = contextvars.ContextVar("metrics_calls", default=None)
+
+
+def histogram(name):
+    with _lock:
+        hist = _histograms.get(name)
+        if hist is None:
+            hist = _histograms[name] = Histogram()
+        return hist
+
+
+@contextmanager
+def timed(upstream, endpoint):
+    """Замеряет вызов; вызывающий заполняет status, bytesOut и bytesIn в отдаваемой записи"""
+    record = {"name": f"{upstream}.{endpoint}", "status": 0, "bytesOut": 0, "bytesIn": 0}
+    started = time.perf_counter()
+    try:
+        yield record
+    finally:
+        record["ms"] = round((time.perf_counter() - started) * 1000, 1)
+        histogram(record["name"]).observe(record["ms"], record["status"], record["bytesOut"], record["bytesIn"])
+        calls = _calls.get()
+        if calls is not None:
+            with _lock:
+                calls.append(record)
+
+
+def propagate(fn):
+    """fn для пула потоков: вызовы из неё засчитываются вызову handler, который её отправил в пул,
+    а строки лога идут с его rid"""
+    context = contextvars.copy_context()
+
+    def run(*args, **kwargs):
+        # Один Context нельзя войти из двух потоков сразу: каждый запуск — в своей копии
+        return context.copy().run(fn, *args, **kwargs)
+    return run
+
+
+def snapshot():
+    with _lock:
+        names = list(_histograms)
+    return {name: histogram(name).snapshot() for name in names}
+
+
+def server_timing(calls, total_ms):
+    """Значение заголовка Server-Timing: суммарное время по каждому методу и общее время обработки"""
+    per_name = {}
+    for call in calls:
+        ms, count = per_name.get(call["name"], (0.0, 0))
+        per_name[call["name"]] = (ms + call["ms"], count + 1)
+    parts = [
+        f'{name.replace(".", "-")};dur={ms:.1f};desc="{count}x"'
+        for name, (ms, count) in per_name.items()
+    ]
+    parts.append(f"total;dur={total_ms:.1f}")
+    return ", ".join(parts)
+
+
+def instrumented(function_name):
+    """Декоратор handler: идентификатор вызова в логе и ответе, Server-Timing и одна строка метрик на вызов"""
+    def decorate(handler):
+        @functools.wraps(handler)
+        def wrapper(event, context):
+            rid = log.bind(function_name, event, context)
+            token = _calls.set([])
+            started = time.perf_counter()
+            try:
+                response = handler(event, context)
+            finally:
+                total_ms = (time.perf_counter() - started) * 1000
+                with _lock:
+                    calls = list(_calls.get())
+                _calls.reset(token)
+
+            headers = dict(response.get("headers") or {})
+            headers["Server-Timing"] = server_timing(calls, total_ms)
+            headers["Timing-Allow-Origin"] = "*"
+            headers["X-Request-Id"] = rid
+            response = dict(response, headers=headers)
+
+            log.info("invocation", status=response.get("statusCode"), ms=round(total_ms, 1), calls=calls)
+            return response
+        return wrapper
+    return decorate
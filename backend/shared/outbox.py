@@ -0,0 +1,200 @@
+"""Очередь выпуска сертификатов (outbox) с повторами и dead-letter"""
+import json
+import os
+import random
+import threading
+import time
+
+from shared import breaker, log, metrics
+from shared.fulfillment import create_certificate
+from shared.storage import FulfillmentStore, connect, ensure_schema, require_shared
+
+MAX_ATTEMPTS = int(os.environ.get("OUTBOX_MAX_ATTEMPTS", "8"))
+BASE_BACKOFF = float(os.environ.get("OUTBOX_BASE_BACKOFF", "5"))
+MAX_BACKOFF = float(os.environ.get("OUTBOX_MAX_BACKOFF", "900"))
+LEASE_SECONDS = float(os.environ.get("OUTBOX_LEASE_SECONDS", "120"))
+WORKERS = int(os.environ.get("OUTBOX_WORKERS", "4"))
+
+PENDING = "pending"
+PROCESSING = "processing"
+DONE = "done"
+DEAD = "dead"
+
+
+def backoff(attempts):
+    """Экспоненциальная задержка с джиттером перед следующей попыткой"""
+    delay = min(BASE_BACKOFF * (2 ** (attempts - 1)), MAX_BACKOFF)
+    return delay * random.uniform(0.5, 1.0)
+
+
+class Outbox:
+    def __init__(self, conn=None):
+        self.conn = conn or connect()
+        ensure_schema(
+            self.conn,
+            "CREATE TABLE IF NOT EXISTS outbox ("
+            "order_id TEXT PRIMARY KEY, "
+            "payload TEXT NOT NULL, "
+            "status TEXT NOT NULL, "
+            "attempts INTEGER NOT NULL DEFAULT 0, "
+            "next_attempt_at REAL NOT NULL, "
+            "last_error TEXT, "
+            "created_at REAL NOT NULL, "
+            "updated_at REAL NOT NULL)"
+        )
+        ensure_schema(self.conn, "CREATE INDEX IF NOT EXISTS outbox_due ON outbox (status, next_attempt_at)")
+
+    def enqueue(self, order_id, payload):
+        # Очередь в базе контейнера умирает вместе с ним, а другой контейнер поставил бы заказ ещё раз
+        require_shared("очередь выпуска сертификатов")
+        now = time.time()
+        self.conn.execute(
+            "INSERT OR IGNORE INTO outbox (order_id, payload, status, next_attempt_at, created_at, updated_at) "
+            "VALUES (?, ?, ?, ?, ?, ?)",
+            (order_id, json.dumps(payload, ensure_ascii=False), PENDING, now, now, now),
+        )
+
+    def get(self, order_id):
+        row = self.conn.execute(
+            "SELECT status, attempts, last_error FROM outbox WHERE order_id = ?", (order_id,)
+        ).fetchone()
+        if not row:
+            return None
+        return {"status": row[0], "attempts": row[1], "lastError": row[2]}
+
+    def existing(self, order_ids):
+        order_ids = list(order_ids)
+        if not order_ids:
+            return set()
+        placeholders = ", ".join("?" * len(order_ids))
+        rows = self.conn.execute(
+            f"SELECT order_id FROM outbox WHERE order_id IN ({placeholders})", order_ids
+        ).fetchall()
+        return {row[0] for row in rows}
+
+    def claim(self, limit):
+        """Забирает готовые к обработке записи; зависшие в processing дольше аренды возвращаются в работу"""
+        now = time.time()
+        self.conn.execute("BEGIN IMMEDIATE")
+        try:
+            rows = self.conn.execute(
+                "SELECT order_id, payload, attempts FROM outbox "
+                "WHERE (status = ? AND next_attempt_at <= ?) OR (status = ? AND updated_at <= ?) "
+                "ORDER BY next_attempt_at LIMIT ?",
+                (PENDING, now, PROCESSING, now - LEASE_SECONDS, limit),
+            ).fetchall()
+            self.conn.executemany(
+                "UPDATE outbox SET status = ?, updated_at = ? WHERE order_id = ?",
+                [(PROCESSING, now, row[0]) for row in rows],
+            )
+            self.conn.execute("COMMIT")
+        except Exception:
+            self.conn.execute("ROLLBACK")
+            raise
+        return [(row[0], json.loads(row[1]), row[2]) for row in rows]
+
+    def claim_order(self, order_id):
+        """Забирает конкретный заказ в обработку; None, если он уже выполнен или занят"""
+        now = time.time()
+        cur = self.conn.execute(
+            "UPDATE outbox SET status = ?, updated_at = ? "
+            "WHERE order_id = ? AND (status = ? OR (status = ? AND updated_at <= ?))",
+            (PROCESSING, now, order_id, PENDING, PROCESSING, now - LEASE_SECONDS),
+        )
+        if cur.rowcount != 1:
+            return None
+        return self.get(order_id)["attempts"]
+
+    def complete(self, order_id):
+        self.conn.execute(
+            "UPDATE outbox SET status = ?, last_error = NULL, updated_at = ? WHERE order_id = ?",
+            (DONE, time.time(), order_id),
+        )
+
+    def fail(self, order_id, attempts, error):
+        now = time.time()
+        status = DEAD if attempts >= MAX_ATTEMPTS else PENDING
+        self.conn.execute(
+            "UPDATE outbox SET status = ?, attempts = ?, next_attempt_at = ?, last_error = ?, updated_at = ? "
+            "WHERE order_id = ?",
+            (status, attempts, now + backoff(attempts), str(error), now, order_id),
+        )
+        return status
+
+    def defer(self, order_id, delay):
+        """Откладывает запись без расхода попытки — например, пока цепь к Prime Hill разомкнута"""
+        now = time.time()
+        self.conn.execute(
+            "UPDATE outbox SET status = ?, next_attempt_at = ?, updated_at = ? WHERE order_id = ?",
+            (PENDING, now + delay, now, order_id),
+        )
+
+    def depth(self):
+        counts = {PENDING: 0, PROCESSING: 0, DONE: 0, DEAD: 0}
+        for status, count in self.conn.execute("SELECT status, COUNT(*) FROM outbox GROUP BY status"):
+            counts[status] = count
+        return counts
+
+
+def process(order_id, payload, attempts):
+    """Выпускает сертификат по записи outbox; соединения SQLite свои у каждого потока"""
+    require_shared("выпуск сертификатов из очереди")
+    outbox = Outbox()
+    store = FulfillmentStore()
+    if store.get(order_id):
+        outbox.complete(order_id)
+        return DONE
+
+    circuit = breaker.get("ph")
+    if circuit.is_open():
+        outbox.defer(order_id, circuit.retry_after())
+        return PENDING
+
+    try:
+        certificate, error = create_certificate(
+            payload["recipientName"], payload["senderName"], payload["nominal"], order_ref=order_id,
+        )
+    except Exception as e:
+        certificate, error = None, str(e)
+
+    if error:
+        status = outbox.fail(order_id, attempts + 1, error)
+        log.warning("outbox.attempt failed", orderId=order_id, attempt=attempts + 1, status=status, error=error)
+        return status
+
+    store.save(order_id, certificate)
+    outbox.complete(order_id)
+    return DONE
+
+
+def drain(workers=WORKERS, batch=None, deadline=None):
+    """Обрабатывает очередь пачками на пуле из workers потоков до опустошения или deadline"""
+    from concurrent.futures import ThreadPoolExecutor
+
+    require_shared("обработка очереди выпуска")
+
+    outbox = Outbox()
+    batch = batch or workers * 4
+    processed = {DONE: 0, PENDING: 0, DEAD: 0}
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        while deadline is None or time.time() < deadline:
+            items = outbox.claim(batch)
+            if not items:
+                break
+            for status in pool.map(metrics.propagate(lambda item: process(*item)), items):
+                processed[status] = processed.get(status, 0) + 1
+    return processed
+
+
+_background = None
+_background_lock = threading.Lock()
+
+
+def drain_in_background():
+    """Запускает фоновую обработку очереди, если она ещё не идёт в этом контейнере"""
+    global _background
+    with _background_lock:
+        if _background is not None and _background.is_alive():
+            return
+        _background = threading.Thread(target=drain, daemon=True)
+        _background.start()
@@ -0,0 +1,175 @@
+"""Клиент Prime Hill Open API v2"""
+import hashlib
+import json
+import os
+import urllib.parse
+from datetime import datetime
+
+from shared import breaker, http_client, identity, metrics, ratelimit
+from shared.cache import TTLCache
+
+PRIME_HILL_BASE = os.environ.get("PRIME_HILL_API_URL", "https://open-api.p-h.app/api/v2")
+PRIME_HILL_API_KEY = os.environ.get("PRIME_HILL_API_KEY", "")
+TEMPLATE_ID = 15852
+
+# Время жизни ответов GET-методов: (fresh, stale) в секундах
+CACHE_TTLS = {
+    "ping": (10, 20),
+    "getTemplates": (600, 3600),
+    "getClients": (30, 120),
+}
+# Какие закэшированные методы устаревают после успешного изменяющего вызова
+INVALIDATES = {
+    "createClients": ("getClients",),
+    "createOrder": ("getClients",),
+}
+
+ph_cache = TTLCache(
+    maxsize=int(os.environ.get("PH_CACHE_SIZE", "128")),
+    disk=os.environ.get("PH_CACHE_DISK", "") == "1",
+)
+
+
+def ph_request(method, endpoint, data=None, params=None, max_wait=ratelimit.MAX_WAIT):
+    """Запрос к Prime Hill через breaker и лимитер; max_wait=None — ждать токен лимитера без срока"""
+    if params is None:
+        params = {}
+    params["token"] = PRIME_HILL_API_KEY
+
+    query_string = urllib.parse.urlencode(params)
+    url = f"{PRIME_HILL_BASE}/{endpoint}?{query_string}"
+
+    body = None
+    if data is not None:
+        body = json.dumps(data).encode("utf-8")
+
+    # Разомкнутая цепь отвечает сразу: ожидание токена лимитера здесь только задержало бы быстрый 503
+    circuit = breaker.get("ph")
+    if not circuit.allow():
+        return {
+            "ok": False, "status": 503, "error": "Prime Hill временно недоступен",
+            "circuitOpen": True, "retryable": True, "retryAfter": circuit.retry_after(),
+        }
+
+    if not ratelimit.acquire(endpoint, max_wait):
+        circuit.release()
+        return {
+            "ok": False, "status": 429, "error": "Превышен лимит запросов к Prime Hill",
+            "rateLimited": True, "retryable": True, "retryAfter": 1,
+        }
+
+    with metrics.timed("ph", endpoint) as record:
+        record["bytesOut"] = len(body) if body else 0
+        try:
+            resp = http_client.request(
+                method, url, body=body,
+                headers={"Content-Type": "application/json"} if body else {},
+                read_timeout=breaker.read_timeout(f"ph.{endpoint}", adaptive=method == "GET"),
+            )
+        except Exception as e:
+            circuit.record(False)
+            return {"ok": False, "status": 500, "error": str(e)}
+        record["status"] = resp.status
+        record["bytesIn"] = len(resp.body)
+    circuit.record(resp.status < 500)
+
+    raw = resp.text()
+    if resp.status >= 400:
+        err = raw
+        try:
+            err = json.loads(err)
+        except Exception:
+            pass
+        return {"ok": False, "status": resp.status, "error": err}
+
+    try:
+        result = {"ok": True, "status": resp.status, "data": json.loads(raw) if raw else {}}
+    except Exception as e:
+        return {"ok": False, "status": 500, "error": str(e)}
+
+    for cached_endpoint in INVALIDATES.get(endpoint, ()):
+        ph_cache.invalidate(cached_endpoint + "?")
+    if endpoint == "createOrder" and params.get("type") == "clientId":
+        ph_cache.invalidate(balance_key(params.get("id", "")))
+    return result
+
+
+def balance_key(client_id):
+    """Ключ кэша остатка; "&" в конце не даёт сбросу clientId=12 задеть clientId=123"""
+    return f"balance?clientId={client_id}&"
+
+
+def ph_cached_get(endpoint, params=None):
+    """GET через TTL-кэш; ошибки не кэшируются"""
+    ttl, stale_ttl = CACHE_TTLS[endpoint]
+    key = endpoint + "?" + urllib.parse.urlencode(sorted((params or {}).items()))
+    return ph_cache.get_or_load(
+        key,
+        lambda: ph_request("GET", endpoint, params=dict(params or {})),
+        ttl,
+        stale_ttl,
+        cacheable=lambda result: result.get("ok"),
+    )
+
+
+def gen_phone(ref=None):
+    """Телефон из хэша ref (orderId); для одного ref — всегда один и тот же в любом контейнере"""
+    return identity.allocate_phone(ref)
+
+
+def build_client(recipient_name, sender_name, nominal, phone):
+    """Карточка клиента-сертификата для createClients"""
+    name_parts = recipient_name.split(" ", 2)
+    first_name = name_parts[0] if len(name_parts) > 0 else recipient_name
+    last_name = name_parts[1] if len(name_parts) > 1 else ""
+    patronymic = name_parts[2] if len(name_parts) > 2 else ""
+
+    return {
+        "lastName": last_name if last_name else "Сертификат",
+        "firstName": first_name,
+        "patronymic": patronymic if patronymic else "",
+        "birthday": "2000-01-01",
+        "sex": 0,
+        "email": "",
+        "phone": phone,
+        "templateId": TEMPLATE_ID,
+        "cardNumber": "",
+        "cardBarcode": "",
+        "comment": f"Сертификат Sweep GIFT на {nominal} руб." + (f" от {sender_name}" if sender_name else ""),
+        "parent": 0,
+        "tags": [],
+    }
+
+
+def build_deposit_order(nominal, order_ref=None):
+    """Заказ createOrder, пополняющий депозит карты на номинал сертификата.
+
+    Для заказа с order_ref guid выводится из него: повтор после потерянного ответа — тот же заказ в Prime Hill,
+    а не второе пополнение.
+    """
+    if order_ref:
+        order_guid = hashlib.sha256(f"deposit:{order_ref}".encode("utf-8")).hexdigest()[:16]
+    else:
+        order_guid = os.urandom(8).hex()
+    return {
+        "guid": order_guid,
+        "number": f"SG-{order_guid[:8]}",
+        "date": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+        "sum": 0,
+        "sumDiscount": 0,
+        "bonusAdd": 0,
+        "bonusWriteOff": 0,
+        "depositAdd": float(nominal),
+        "depositWriteOff": 0,
+        "cart": [
+            {
+                "name": f"Подарочный сертификат {nominal} руб.",
+                "nid": order_guid,
+                "groupId": "certificates",
+                "groupName": "Сертификаты",
+                "price": float(nominal),
+                "priceWithDiscount": float(nominal),
+                "amount": 1,
+            }
+        ],
+    }
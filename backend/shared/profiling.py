@@ -0,0 +1,145 @@
+"""Профилирование отдельных вызовов handler: cProfile и tracemalloc по выборке или подписанному заголовку.
+
+Включается долей PROFILE_SAMPLE или заголовком X-Profile: "<unix-время>.<hmac-sha256(PROFILE_SECRET, "<fn>:<unix-время>")>".
+Если ни то ни другое не настроено, декоратор возвращает handler без обёртки. Результат — компактный JSON
+в PROFILE_DIR; сравнивать прогоны можно через loadtest/profile_compare.py. cProfile видит только поток
+handler: работа в пулах потоков попадает в профиль как ожидание результата.
+"""
+import functools
+import json
+import os
+import random
+import threading
+import time
+
+from shared import log
+
+SAMPLE = float(os.environ.get("PROFILE_SAMPLE", "0"))
+SECRET = os.environ.get("PROFILE_SECRET", "")
+SIGNATURE_TTL = 300
+PROFILE_DIR = os.environ.get("PROFILE_DIR", "/tmp/sweep_profiles")
+TOP = int(os.environ.get("PROFILE_TOP", "30"))
+BACKEND = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# cProfile и tracemalloc глобальны для процесса: одновременно профилируется один вызов
+_busy = threading.Lock()
+
+
+def sign(function_name, timestamp, secret=SECRET):
+    import hashlib
+    import hmac
+
+    return hmac.new(secret.encode("utf-8"), f"{function_name}:{timestamp}".encode("utf-8"), hashlib.sha256).hexdigest()
+
+
+def signed(function_name, event):
+    """Заголовок X-Profile с действующей подписью для этой функции"""
+    if not SECRET:
+        return False
+    value = ""
+    for key, item in (event.get("headers") or {}).items():
+        if key.lower() == "x-profile":
+            value = item or ""
+    timestamp, _, signature = value.partition(".")
+    if not timestamp.isdigit() or abs(time.time() - int(timestamp)) > SIGNATURE_TTL:
+        return False
+    import hmac
+
+    return hmac.compare_digest(sign(function_name, timestamp), signature)
+
+
+def short_path(path):
+    if path.startswith(BACKEND + os.sep):
+        return os.path.relpath(path, BACKEND)
+    for marker in ("site-packages" + os.sep, os.sep + "lib" + os.sep):
+        if marker in path:
+            return path.rsplit(marker, 1)[1]
+    return path
+
+
+def cpu_top(profiler):
+    import pstats
+
+    stats = pstats.Stats(profiler).stats
+    rows = sorted(stats.items(), key=lambda row: row[1][3], reverse=True)[:TOP]
+    return [
+        {
+            "f": f"{short_path(filename)}:{line}({name})",
+            "n": calls,
+            "selfMs": round(own * 1000, 3),
+            "cumMs": round(cumulative * 1000, 3),
+        }
+        for (filename, line, name), (_, calls, own, cumulative, _) in rows
+    ]
+
+
+def alloc_top(snapshot):
+    import tracemalloc
+
+    snapshot = snapshot.filter_traces((
+        tracemalloc.Filter(False, tracemalloc.__file__),
+        tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+        tracemalloc.Filter(False, __file__),
+    ))
+    return [
+        {"at": f"{short_path(stat.traceback[0].filename)}:{stat.traceback[0].lineno}", "kb": round(stat.size / 1024, 1), "n": stat.count}
+        for stat in snapshot.statistics("lineno")[:TOP]
+    ]
+
+
+def save(artifact):
+    os.makedirs(PROFILE_DIR, exist_ok=True)
+    path = os.path.join(PROFILE_DIR, f"{artifact['fn']}-{int(artifact['ts'] * 1000)}-{artifact['rid']}.json")
+    with open(path, "w") as f:
+        json.dump(artifact, f, ensure_ascii=False, separators=(",", ":"))
+    return path
+
+
+def run_profiled(function_name, handler, event, context):
+    import cProfile
+    import tracemalloc
+
+    profiler = cProfile.Profile()
+    tracemalloc.start()
+    started = time.perf_counter()
+    profiler.enable()
+    try:
+        response = handler(event, context)
+    finally:
+        profiler.disable()
+        total_ms = (time.perf_counter() - started) * 1000
+        snapshot = tracemalloc.take_snapshot()
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+
+    path = save({
+        "fn": function_name,
+        "rid": log.request_id(),
+        "ts": round(time.time(), 3),
+        "status": response.get("statusCode"),
+        "ms": round(total_ms, 2),
+        "peakKb": round(peak / 1024, 1),
+        "cpu": cpu_top(profiler),
+        "alloc": alloc_top(snapshot),
+    })
+    log.info("profile.saved", path=path, ms=round(total_ms, 1))
+    return response
+
+
+def profiled(function_name):
+    """Декоратор handler; без PROFILE_SAMPLE и PROFILE_SECRET handler не оборачивается"""
+    def decorate(handler):
+        if SAMPLE <= 0 and not SECRET:
+            return handler
+
+        @functools.wraps(handler)
+        def wrapper(event, context):
+            wanted = (SAMPLE > 0 and random.random() < SAMPLE) or signed(function_name, event)
+            if not wanted or not _busy.acquire(blocking=False):
+                return handler(event, context)
+            try:
+                return run_profiled(function_name, handler, event, context)
+            finally:
+                _busy.release()
+        return wrapper
+    return decorate
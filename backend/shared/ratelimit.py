@@ -0,0 +1,85 @@
+"""Token bucket для исходящих запросов к Prime Hill с общим состоянием в SQLite"""
+import json
+import os
+import time
+
+from shared.storage import connect, ensure_schema
+
+# Скорость (запросов в секунду) и запас burst по методам; "*" — для остальных методов.
+# createOrder рассчитан на массовый выпуск: BULK_WORKERS параллельных пополнений при обычной задержке
+# Prime Hill укладываются в лимит, а всплеск в начале пачки — в burst
+DEFAULT_LIMITS = {"*": [10, 20], "createClients": [5, 10], "getClients": [2, 4], "createOrder": [50, 100]}
+LIMITS = json.loads(os.environ.get("PH_RATE_LIMITS", "") or "null") or DEFAULT_LIMITS
+MAX_WAIT = float(os.environ.get("PH_RATE_MAX_WAIT", "3"))
+
+
+class TokenBucket:
+    def __init__(self, conn=None):
+        self.conn = conn or connect()
+        ensure_schema(
+            self.conn,
+            "CREATE TABLE IF NOT EXISTS rate_buckets ("
+            "key TEXT PRIMARY KEY, "
+            "tokens REAL NOT NULL, "
+            "updated_at REAL NOT NULL, "
+            "allowed INTEGER NOT NULL DEFAULT 0, "
+            "queued INTEGER NOT NULL DEFAULT 0, "
+            "rejected INTEGER NOT NULL DEFAULT 0)"
+        )
+
+    def take(self, key, rate, burst):
+        """Забирает токен; возвращает 0 или сколько секунд ждать до следующего токена"""
+        now = time.time()
+        self.conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = self.conn.execute("SELECT tokens, updated_at FROM rate_buckets WHERE key = ?", (key,)).fetchone()
+            tokens = burst if row is None else min(burst, row[0] + (now - row[1]) * rate)
+            wait = 0.0
+            if tokens >= 1:
+                tokens -= 1
+            else:
+                wait = (1 - tokens) / rate
+            self.conn.execute(
+                "INSERT INTO rate_buckets (key, tokens, updated_at) VALUES (?, ?, ?) "
+                "ON CONFLICT (key) DO UPDATE SET tokens = excluded.tokens, updated_at = excluded.updated_at",
+                (key, tokens, now),
+            )
+            self.conn.execute("COMMIT")
+        except Exception:
+            self.conn.execute("ROLLBACK")
+            raise
+        return wait
+
+    def count(self, key, outcome):
+        self.conn.execute(f"UPDATE rate_buckets SET {outcome} = {outcome} + 1 WHERE key = ?", (key,))
+
+    def snapshot(self):
+        rows = self.conn.execute("SELECT key, tokens, allowed, queued, rejected FROM rate_buckets").fetchall()
+        return {
+            row[0]: {"tokens": round(row[1], 2), "allowed": row[2], "queued": row[3], "rejected": row[4]}
+            for row in rows
+        }
+
+
+def limits_for(endpoint):
+    rate, burst = LIMITS.get(endpoint) or LIMITS["*"]
+    return float(rate), float(burst)
+
+
+def acquire(endpoint, max_wait=MAX_WAIT):
+    """Ждёт токен не дольше max_wait секунд (None — без срока); False — запрос отклонён лимитером"""
+    rate, burst = limits_for(endpoint)
+    key = f"ph.{endpoint}" if endpoint in LIMITS else "ph.*"
+    bucket = TokenBucket()
+    deadline = float("inf") if max_wait is None else time.time() + max_wait
+    queued = False
+    while True:
+        wait = bucket.take(key, rate, burst)
+        if wait == 0:
+            bucket.count(key, "queued" if queued else "allowed")
+            return True
+        if time.time() + wait > deadline:
+            bucket.count(key, "rejected")
+            return False
+        queued = True
+        time.sleep(wait)
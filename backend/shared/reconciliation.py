@@ -0,0 +1,129 @@
+"""Сверка оплаченных заказов Альфа-Банка с выпущенными сертификатами"""
+import os
+import time
+from datetime import datetime, timedelta
+
+from shared import log
+from shared.alfa import alfa_request
+from shared.fulfillment import is_paid, order_payload
+from shared.outbox import Outbox, drain
+from shared.storage import FulfillmentStore, connect, ensure_schema, require_shared
+
+WINDOW_HOURS = float(os.environ.get("RECONCILE_WINDOW_HOURS", "72"))
+PAGE_SIZE = int(os.environ.get("RECONCILE_PAGE_SIZE", "200"))
+WORKERS = int(os.environ.get("RECONCILE_WORKERS", "8"))
+
+RUNNING = "running"
+FINISHED = "finished"
+# Прогон, который не дошёл до конца окна, пока окно не вышло за горизонт сверки RECONCILE_WINDOW_HOURS
+ABANDONED = "abandoned"
+TIME_FORMAT = "%Y%m%d%H%M%S"
+
+
+class Checkpoint:
+    """Окно сверки и последняя обработанная страница: прерванный прогон продолжается с неё"""
+
+    def __init__(self, conn=None):
+        self.conn = conn or connect()
+        ensure_schema(
+            self.conn,
+            "CREATE TABLE IF NOT EXISTS reconcile_runs ("
+            "run_id INTEGER PRIMARY KEY AUTOINCREMENT, "
+            "window_from TEXT NOT NULL, "
+            "window_to TEXT NOT NULL, "
+            "next_page INTEGER NOT NULL, "
+            "scanned INTEGER NOT NULL DEFAULT 0, "
+            "enqueued INTEGER NOT NULL DEFAULT 0, "
+            "status TEXT NOT NULL, "
+            "updated_at REAL NOT NULL)"
+        )
+
+    def resume_or_start(self, hours):
+        """Продолжает незавершённый прогон; если его окно старше hours (например, листинг постоянно
+        падал с ошибкой), прогон закрывается и начинается новое окно, чтобы свежие заказы не ждали вечно"""
+        now = datetime.now()
+        row = self.conn.execute(
+            "SELECT run_id, window_from, window_to, next_page, scanned, enqueued FROM reconcile_runs "
+            "WHERE status = ? ORDER BY run_id DESC LIMIT 1",
+            (RUNNING,),
+        ).fetchone()
+        if row:
+            run = dict(zip(("runId", "from", "to", "page", "scanned", "enqueued"), row))
+            if now - datetime.strptime(run["to"], TIME_FORMAT) <= timedelta(hours=hours):
+                return run
+            self.save(run, ABANDONED)
+
+        window_from = (now - timedelta(hours=hours)).strftime(TIME_FORMAT)
+        window_to = now.strftime(TIME_FORMAT)
+        cur = self.conn.execute(
+            "INSERT INTO reconcile_runs (window_from, window_to, next_page, status, updated_at) VALUES (?, ?, 0, ?, ?)",
+            (window_from, window_to, RUNNING, time.time()),
+        )
+        return {"runId": cur.lastrowid, "from": window_from, "to": window_to, "page": 0, "scanned": 0, "enqueued": 0}
+
+    def save(self, run, status=RUNNING):
+        self.conn.execute(
+            "UPDATE reconcile_runs SET next_page = ?, scanned = ?, enqueued = ?, status = ?, updated_at = ? "
+            "WHERE run_id = ?",
+            (run["page"], run["scanned"], run["enqueued"], status, time.time(), run["runId"]),
+        )
+
+
+def order_id_of(order):
+    for attribute in order.get("attributes", []):
+        if attribute.get("name") == "mdOrder":
+            return attribute.get("value", "")
+    return order.get("orderId", "")
+
+
+def reconcile(hours=WINDOW_HOURS, deadline=None, workers=WORKERS):
+    """Постранично сверяет оплаченные заказы окна, ставит невыпущенные в outbox и обрабатывает очередь.
+
+    Без общей базы выпущенные в других контейнерах сертификаты здесь не видны, и каждый оплаченный заказ
+    окна был бы выпущен повторно, поэтому сверка отказывается работать.
+    """
+    require_shared("сверка")
+    checkpoint = Checkpoint()
+    store = FulfillmentStore()
+    outbox = Outbox()
+    run = checkpoint.resume_or_start(hours)
+
+    finished = False
+    while deadline is None or time.time() < deadline:
+        listing = alfa_request("getLastOrdersForMerchants.do", {
+            "size": str(PAGE_SIZE),
+            "page": str(run["page"]),
+            "from": run["from"],
+            "to": run["to"],
+            "transactionStates": "DEPOSITED",
+            "merchants": "",
+        })
+        if listing.get("errorCode") not in (None, "", "0", 0):
+            run["error"] = listing.get("errorMessage", "")
+            log.warning("reconcile.listing failed", runId=run["runId"], page=run["page"], error=run["error"])
+            checkpoint.save(run)
+            break
+
+        orders = [order for order in listing.get("orderStatuses", []) if is_paid(order)]
+        by_id = {order_id_of(order): order for order in orders}
+        by_id.pop("", None)
+        known = store.existing(by_id) | outbox.existing(by_id)
+        for order_id, order in by_id.items():
+            if order_id in known:
+                continue
+            payload = order_payload(order)
+            if payload:
+                outbox.enqueue(order_id, payload)
+                run["enqueued"] += 1
+
+        run["scanned"] += len(listing.get("orderStatuses", []))
+        run["page"] += 1
+        total = int(listing.get("totalCount", 0) or 0)
+        finished = run["page"] * PAGE_SIZE >= total or not listing.get("orderStatuses")
+        checkpoint.save(run, FINISHED if finished else RUNNING)
+        if finished:
+            break
+
+    run["finished"] = finished
+    run["processed"] = drain(workers=workers, deadline=deadline)
+    return run
@@ -0,0 +1,153 @@
+"""Отрисовка сертификата в PNG и PDF с QR-кодом и штрихкодом; готовые файлы лежат в кэше по хэшу содержимого"""
+import hashlib
+import io
+import json
+import math
+import os
+
+# Меняется при любом изменении макета: старые файлы кэша перестают совпадать по хэшу
+TEMPLATE = "sweep-v2"
+CACHE_DIR = os.environ.get("RENDER_CACHE_DIR", "/tmp/sweep_renders")
+# Шрифт с кириллицей лежит рядом с модулем: встроенный шрифт Pillow рисует русский текст квадратами
+FONT_PATH = os.environ.get("RENDER_FONT", os.path.join(os.path.dirname(os.path.abspath(__file__)), "fonts", "DejaVuSans.ttf"))
+WORKERS = int(os.environ.get("RENDER_WORKERS", "4"))
+FORMATS = ("png", "pdf")
+
+WIDTH, HEIGHT = 1200, 1600
+BACKGROUND = (26, 26, 26)
+FOREGROUND = (245, 240, 235)
+MUTED = (140, 136, 132)
+
+
+def normalize_nominal(value):
+    """Номинал как конечное неотрицательное число: 1000, "1000" и 1000.0 дают одно и то же значение
+    и один ключ кэша; ValueError для всего остального"""
+    number = float(value)
+    if not math.isfinite(number) or number < 0:
+        raise ValueError(f"Некорректный номинал: {value!r}")
+    return int(number) if number.is_integer() else round(number, 2)
+
+
+def render_key(certificate):
+    """Хэш макета и полей, которые попадают на изображение"""
+    fields = [
+        TEMPLATE,
+        str(certificate.get("cardNumber", "")),
+        str(certificate.get("cardBarcode", "")),
+        normalize_nominal(certificate.get("nominal", 0)),
+        certificate.get("recipientName", ""),
+        certificate.get("senderName", ""),
+    ]
+    return hashlib.sha256(json.dumps(fields, ensure_ascii=False).encode("utf-8")).hexdigest()
+
+
+def cache_path(key, fmt):
+    return os.path.join(CACHE_DIR, f"{key}.{fmt}")
+
+
+def cached(key, fmt):
+    """Содержимое файла из кэша или None"""
+    try:
+        with open(cache_path(key, fmt), "rb") as f:
+            return f.read()
+    except FileNotFoundError:
+        return None
+
+
+def _font(size):
+    from PIL import ImageFont
+
+    try:
+        return ImageFont.truetype(FONT_PATH, size)
+    except OSError:
+        return ImageFont.load_default(size)
+
+
+def _format_price(value):
+    value = normalize_nominal(value)
+    whole, _, fraction = f"{value:,.2f}".partition(".")
+    return whole.replace(",", " ") + ("" if isinstance(value, int) else f",{fraction}") + " ₽"
+
+
+def draw(certificate):
+    """Изображение сертификата в духе CertificatePreview"""
+    import barcode
+    import qrcode
+    from barcode.writer import ImageWriter
+    from PIL import Image, ImageDraw
+
+    image = Image.new("RGB", (WIDTH, HEIGHT), BACKGROUND)
+    canvas = ImageDraw.Draw(image)
+    margin = 96
+
+    canvas.text((margin, margin), "SWEEP GIFT", font=_font(36), fill=MUTED)
+    canvas.text((margin, 300), "ПОДАРОЧНЫЙ СЕРТИФИКАТ", font=_font(30), fill=MUTED)
+    canvas.text((margin, 350), _format_price(certificate.get("nominal", 0)), font=_font(120), fill=FOREGROUND)
+
+    canvas.line((margin, 720, WIDTH - margin, 720), fill=MUTED, width=2)
+    canvas.text((margin, 760), "ДЛЯ", font=_font(28), fill=MUTED)
+    canvas.text((margin, 800), certificate.get("recipientName", ""), font=_font(72), fill=FOREGROUND)
+    if certificate.get("senderName"):
+        canvas.text((margin, 920), "ОТ", font=_font(28), fill=MUTED)
+        canvas.text((margin, 960), certificate["senderName"], font=_font(48), fill=FOREGROUND)
+    canvas.line((margin, 1080, WIDTH - margin, 1080), fill=MUTED, width=2)
+
+    card_number = str(certificate.get("cardNumber", ""))
+    qr_data = card_number or str(certificate.get("cardBarcode", "")) or str(certificate.get("qrUrl", ""))
+    if qr_data:
+        qr = qrcode.QRCode(border=1, box_size=10)
+        qr.add_data(qr_data)
+        qr_image = qr.make_image(fill_color=FOREGROUND, back_color=BACKGROUND).convert("RGB").resize((360, 360))
+        image.paste(qr_image, (WIDTH - margin - 360, 1140))
+
+    card_barcode = str(certificate.get("cardBarcode", "")) or card_number
+    if card_barcode:
+        buffer = io.BytesIO()
+        barcode.get("code128", card_barcode, writer=ImageWriter()).write(buffer, options={"write_text": False})
+        barcode_image = Image.open(buffer).convert("RGB").resize((560, 160))
+        image.paste(barcode_image, (margin, 1200))
+
+    if card_number:
+        canvas.text((margin, 1390), f"№ {card_number}", font=_font(32), fill=MUTED)
+    canvas.text((margin, 1440), "sweepgift.ru", font=_font(28), fill=MUTED)
+    return image
+
+
+def render(certificate):
+    """Рисует сертификат, если его ещё нет в кэше; возвращает ключ кэша"""
+    key = render_key(certificate)
+    if all(os.path.exists(cache_path(key, fmt)) for fmt in FORMATS):
+        return key
+
+    image = draw(certificate)
+    os.makedirs(CACHE_DIR, exist_ok=True)
+    for fmt in FORMATS:
+        buffer = io.BytesIO()
+        if fmt == "pdf":
+            image.save(buffer, format="PDF", resolution=150.0)
+        else:
+            image.save(buffer, format="PNG", optimize=True)
+        # Запись через временный файл: параллельный читатель не увидит недописанный файл
+        tmp_path = f"{cache_path(key, fmt)}.{os.getpid()}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(buffer.getvalue())
+        os.replace(tmp_path, cache_path(key, fmt))
+    return key
+
+
+def render_batch(certificates, workers=WORKERS):
+    """Рисует пакет сертификатов в пуле процессов; уже закэшированные не перерисовываются"""
+    keys = [render_key(certificate) for certificate in certificates]
+    missing = {}
+    for key, certificate in zip(keys, certificates):
+        if key not in missing and not all(os.path.exists(cache_path(key, fmt)) for fmt in FORMATS):
+            missing[key] = certificate
+    if len(missing) == 1 or workers <= 1:
+        for certificate in missing.values():
+            render(certificate)
+    elif missing:
+        from concurrent.futures import ProcessPoolExecutor
+
+        with ProcessPoolExecutor(max_workers=min(workers, len(missing))) as pool:
+            list(pool.map(render, missing.values()))
+    return keys, set(missing)
@@ -0,0 +1,99 @@
+"""Склейка одновременных запросов по ключу: работу делает первый, остальные ждут и получают его результат"""
+import os
+import threading
+import time
+
+from shared.storage import connect, ensure_schema
+
+LEASE_SECONDS = float(os.environ.get("SINGLEFLIGHT_LEASE_SECONDS", "30"))
+WAIT_SECONDS = float(os.environ.get("SINGLEFLIGHT_WAIT_SECONDS", "20"))
+POLL_SECONDS = 0.1
+
+OWNER = os.urandom(16).hex()
+
+
+class Lease:
+    """Аренда ключа в общей SQLite-базе — между процессами и контейнерами с общим SWEEP_DB_PATH"""
+
+    def __init__(self, key, conn=None):
+        self.key = key
+        self.token = f"{OWNER}:{threading.get_ident()}"
+        self.conn = conn or connect()
+        ensure_schema(
+            self.conn,
+            "CREATE TABLE IF NOT EXISTS leases (key TEXT PRIMARY KEY, owner TEXT NOT NULL, expires_at REAL NOT NULL)"
+        )
+
+    def acquire(self, ttl=LEASE_SECONDS):
+        now = time.time()
+        cur = self.conn.execute(
+            "INSERT INTO leases (key, owner, expires_at) VALUES (?, ?, ?) "
+            "ON CONFLICT (key) DO UPDATE SET owner = excluded.owner, expires_at = excluded.expires_at "
+            "WHERE leases.expires_at <= ?",
+            (self.key, self.token, now + ttl, now),
+        )
+        return cur.rowcount == 1
+
+    def release(self):
+        self.conn.execute("DELETE FROM leases WHERE key = ? AND owner = ?", (self.key, self.token))
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+_calls = {}
+_lock = threading.Lock()
+
+
+def run(key, fn, ready=lambda: None, wait=WAIT_SECONDS):
+    """Выполняет fn() один раз на ключ.
+
+    В процессе ожидающие получают результат лидера. Между процессами лидер держит аренду, а остальные
+    опрашивают ready() — общий результат в хранилище — пока аренда не освободится. После wait секунд
+    ожидания fn() выполняется без координации, поэтому fn должна быть идемпотентной.
+    """
+    with _lock:
+        call = _calls.get(key)
+        leader = call is None
+        if leader:
+            call = _calls[key] = _Call()
+
+    if not leader:
+        if call.done.wait(wait):
+            if call.error is not None:
+                raise call.error
+            return call.result
+        return fn()
+
+    try:
+        call.result = _run_leased(key, fn, ready, wait)
+        return call.result
+    except Exception as e:
+        call.error = e
+        raise
+    finally:
+        with _lock:
+            _calls.pop(key, None)
+        call.done.set()
+
+
+def _run_leased(key, fn, ready, wait):
+    lease = Lease(key)
+    deadline = time.time() + wait
+    while not lease.acquire():
+        result = ready()
+        if result is not None:
+            return result
+        if time.time() >= deadline:
+            return fn()
+        time.sleep(POLL_SECONDS)
+
+    try:
+        result = ready()
+        return result if result is not None else fn()
+    finally:
+        lease.release()
@@ -0,0 +1,78 @@
+"""Общий график опроса статуса во внешнем API: все ожидающие одного ключа делят один запрос на шаг графика"""
+import json
+import time
+
+from shared.singleflight import Lease
+from shared.storage import connect, ensure_schema
+
+# Паузы между запросами статуса, с; после последнего шага график не растёт
+BACKOFF = (1, 1, 2, 2, 3, 5)
+POLL_SECONDS = 0.2
+LEASE_SECONDS = 15
+
+
+class StatusPolls:
+    """Последний полученный статус и время следующего запроса — общие для процессов с одной базой"""
+
+    def __init__(self, conn=None):
+        self.conn = conn or connect()
+        ensure_schema(
+            self.conn,
+            "CREATE TABLE IF NOT EXISTS status_polls ("
+            "key TEXT PRIMARY KEY, "
+            "result TEXT NOT NULL, "
+            "attempt INTEGER NOT NULL, "
+            "checked_at REAL NOT NULL, "
+            "next_check_at REAL NOT NULL)"
+        )
+
+    def get(self, key):
+        row = self.conn.execute(
+            "SELECT result, attempt, next_check_at FROM status_polls WHERE key = ?", (key,)
+        ).fetchone()
+        if row is None:
+            return None
+        return {"result": json.loads(row[0]), "attempt": row[1], "nextCheckAt": row[2]}
+
+    def save(self, key, result, attempt):
+        now = time.time()
+        self.conn.execute(
+            "INSERT OR REPLACE INTO status_polls (key, result, attempt, checked_at, next_check_at) VALUES (?, ?, ?, ?, ?)",
+            (key, json.dumps(result, ensure_ascii=False), attempt, now, now + BACKOFF[min(attempt, len(BACKOFF) - 1)]),
+        )
+
+
+def wait(key, fetch, is_terminal, deadline, cacheable=lambda result: True):
+    """Ждёт терминального результата fetch() не дольше deadline.
+
+    Запрос делает тот, кто взял аренду ключа, когда подошло время следующего шага; остальные читают
+    сохранённый результат. Возвращает терминальный результат, а по истечении deadline — последний
+    известный (None, если статус ещё ни разу не получен). Нетерминальные результаты, которые нельзя
+    кэшировать (ошибки), возвращаются сразу и в общий график не попадают.
+    """
+    polls = StatusPolls()
+    lease = Lease(f"status-poll:{key}")
+    while True:
+        poll = polls.get(key)
+        if poll is not None and is_terminal(poll["result"]):
+            return poll["result"]
+
+        now = time.time()
+        if (poll is None or now >= poll["nextCheckAt"]) and lease.acquire(LEASE_SECONDS):
+            try:
+                result = fetch()
+                if not cacheable(result):
+                    return result
+                # После долгой паузы между ожиданиями график начинается заново
+                fresh = poll is None or now - poll["nextCheckAt"] > BACKOFF[-1]
+                polls.save(key, result, 0 if fresh else poll["attempt"] + 1)
+            finally:
+                lease.release()
+            if is_terminal(result):
+                return result
+            continue
+
+        if now >= deadline:
+            return poll["result"] if poll else None
+        next_step = poll["nextCheckAt"] if poll else now + POLL_SECONDS
+        time.sleep(max(min(next_step, deadline) - now, POLL_SECONDS))
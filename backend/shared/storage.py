@@ -0,0 +1,78 @@
+"""Локальное хранилище выданных сертификатов (SQLite)"""
+import json
+import os
+import sqlite3
+import threading
+import time
+
+DB_PATH = os.environ.get("SWEEP_DB_PATH", "/tmp/sweep_gift.sqlite3")
+# Без SWEEP_DB_PATH база своя у каждого контейнера. Выпуск по уведомлению Альфа-Банка (payment-callback)
+# и чтение результата в check-payment идут в разных контейнерах, поэтому в этом режиме SWEEP_DB_PATH
+# обязателен и у всех функций указывает на один общий смонтированный том
+SHARED = "SWEEP_DB_PATH" in os.environ
+
+_local = threading.local()
+_schema = set()
+
+
+def connect():
+    """Соединение с базой на текущий поток; переживает тёплые вызовы функции"""
+    conn = getattr(_local, "conn", None)
+    if conn is None:
+        conn = sqlite3.connect(DB_PATH, timeout=10, isolation_level=None)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        _local.conn = conn
+    return conn
+
+
+def require_shared(purpose):
+    if not SHARED:
+        raise RuntimeError(f"SWEEP_DB_PATH не задан: {purpose} требует общей для всех функций базы")
+
+
+def ensure_schema(conn, statement):
+    """CREATE ... IF NOT EXISTS выполняется один раз на процесс: тёплые вызовы не повторяют DDL"""
+    key = (DB_PATH, statement)
+    if key not in _schema:
+        conn.execute(statement)
+        _schema.add(key)
+
+
+class FulfillmentStore:
+    """orderId -> выданный сертификат"""
+
+    def __init__(self, conn=None):
+        self.conn = conn or connect()
+        ensure_schema(
+            self.conn,
+            "CREATE TABLE IF NOT EXISTS fulfillments ("
+            "order_id TEXT PRIMARY KEY, "
+            "certificate TEXT NOT NULL, "
+            "created_at REAL NOT NULL)"
+        )
+
+    def get(self, order_id):
+        row = self.conn.execute(
+            "SELECT certificate FROM fulfillments WHERE order_id = ?", (order_id,)
+        ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def existing(self, order_ids):
+        """Какие из заказов уже выполнены — одним запросом на пачку"""
+        order_ids = list(order_ids)
+        if not order_ids:
+            return set()
+        placeholders = ", ".join("?" * len(order_ids))
+        rows = self.conn.execute(
+            f"SELECT order_id FROM fulfillments WHERE order_id IN ({placeholders})", order_ids
+        ).fetchall()
+        return {row[0] for row in rows}
+
+    def save(self, order_id, certificate):
+        """Сохраняет сертификат; если заказ уже выполнен — возвращает ранее сохранённый"""
+        self.conn.execute(
+            "INSERT OR IGNORE INTO fulfillments (order_id, certificate, created_at) VALUES (?, ?, ?)",
+            (order_id, json.dumps(certificate, ensure_ascii=False), time.time()),
+        )
+        return self.get(order_id)
@@ -1,4 +1,4 @@
-import { useState } from "react";
+import { useEffect, useState } from "react";
 import Icon from "@/components/ui/icon";
 import { Input } from "@/components/ui/input";
 import { Button } from "@/components/ui/button";
@@ -10,76 +10,61 @@ import {
   TableHeader,
   TableRow,
 } from "@/components/ui/table";
-import { Badge } from "@/components/ui/badge";
+
+const API_CERTIFICATES = "https://functions.poehali.dev/8e5ac1fd-3bcf-45b6-9870-91adc39ee29f";
+const PAGE_SIZE = 50;
+const SEARCH_DEBOUNCE_MS = 250;
 
 interface Certificate {
-  id: string;
+  clientId: string;
+  orderId: string | null;
   recipientName: string;
   senderName: string;
   nominal: number;
   cardNumber: string;
-  status: "active" | "used" | "expired";
-  createdAt: string;
-  balance: number;
+  createdAt: number;
 }
 
-const MOCK_CERTIFICATES: Certificate[] = [
-  {
-    id: "1",
-    recipientName: "Александр Петров",
-    senderName: "Мария Иванова",
-    nominal: 5000,
-    cardNumber: "SG-00001",
-    status: "active",
-    createdAt: "2026-02-20",
-    balance: 5000,
-  },
-  {
-    id: "2",
-    recipientName: "Елена Сидорова",
-    senderName: "Дмитрий Козлов",
-    nominal: 3000,
-    cardNumber: "SG-00002",
-    status: "used",
-    createdAt: "2026-02-18",
-    balance: 0,
-  },
-  {
-    id: "3",
-    recipientName: "Игорь Новиков",
-    senderName: "",
-    nominal: 10000,
-    cardNumber: "SG-00003",
-    status: "active",
-    createdAt: "2026-02-22",
-    balance: 7500,
-  },
-];
+interface LedgerSummary {
+  count: number;
+  sold: number;
+}
 
 const Admin = () => {
   const [search, setSearch] = useState("");
-  const [certificates] = useState<Certificate[]>(MOCK_CERTIFICATES);
+  const [certificates, setCertificates] = useState<Certificate[]>([]);
+  const [total, setTotal] = useState(0);
+  const [nextCursor, setNextCursor] = useState<string | null>(null);
+  const [summary, setSummary] = useState<LedgerSummary>({ count: 0, sold: 0 });
+  const [loading, setLoading] = useState(false);
 
   const formatPrice = (value: number) => new Intl.NumberFormat("ru-RU").format(value);
 
-  const statusMap = {
-    active: { label: "Активен", variant: "default" as const },
-    used: { label: "Использован", variant: "secondary" as const },
-    expired: { label: "Истёк", variant: "destructive" as const },
+  const loadPage = async (query: string, cursor: string | null) => {
+    setLoading(true);
+    try {
+      const params = new URLSearchParams({ action: "search", q: query, limit: String(PAGE_SIZE) });
+      if (cursor) params.set("cursor", cursor);
+      const response = await fetch(`${API_CERTIFICATES}?${params}`);
+      const data = await response.json();
+      if (!data.ok) return;
+      setCertificates((prev) => (cursor ? [...prev, ...data.items] : data.items));
+      setTotal(data.total);
+      setNextCursor(data.nextCursor);
+      setSummary(data.summary);
+    } catch (err) {
+      console.error("Search error:", err);
+    } finally {
+      setLoading(false);
+    }
   };
 
-  const filtered = certificates.filter(
-    (c) =>
-      c.recipientName.toLowerCase().includes(search.toLowerCase()) ||
-      c.cardNumber.toLowerCase().includes(search.toLowerCase()) ||
-      c.senderName.toLowerCase().includes(search.toLowerCase())
-  );
+  useEffect(() => {
+    const timer = setTimeout(() => loadPage(search, null), SEARCH_DEBOUNCE_MS);
+    return () => clearTimeout(timer);
+  }, [search]);
 
-  const totalActive = certificates.filter((c) => c.status === "active").length;
-  const totalBalance = certificates
-    .filter((c) => c.status === "active")
-    .reduce((sum, c) => sum + c.balance, 0);
-  const totalSold = certificates.reduce((sum, c) => sum + c.nominal, 0);
+  const averageNominal = summary.count ? Math.round(summary.sold / summary.count) : 0;
 
   return (
     <div className="min-h-screen bg-background">
@@ -115,9 +100,9 @@ const Admin = () => {
               <div className="w-9 h-9 rounded-lg bg-secondary flex items-center justify-center">
                 <Icon name="CreditCard" size={18} className="text-muted-foreground" />
               </div>
-              <span className="font-body text-sm text-muted-foreground">Активных</span>
+              <span className="font-body text-sm text-muted-foreground">Выдано</span>
             </div>
-            <p className="font-display text-3xl font-medium">{totalActive}</p>
+            <p className="font-display text-3xl font-medium">{summary.count}</p>
           </div>
 
           <div className="p-6 rounded-xl border border-border bg-card">
@@ -125,9 +110,9 @@ const Admin = () => {
               <div className="w-9 h-9 rounded-lg bg-secondary flex items-center justify-center">
                 <Icon name="Wallet" size={18} className="text-muted-foreground" />
               </div>
-              <span className="font-body text-sm text-muted-foreground">Остаток на картах</span>
+              <span className="font-body text-sm text-muted-foreground">Средний номинал</span>
             </div>
-            <p className="font-display text-3xl font-medium">{formatPrice(totalBalance)} ₽</p>
+            <p className="font-display text-3xl font-medium">{formatPrice(averageNominal)} ₽</p>
           </div>
 
           <div className="p-6 rounded-xl border border-border bg-card">
@@ -137,7 +122,7 @@ const Admin = () => {
               </div>
               <span className="font-body text-sm text-muted-foreground">Продано на сумму</span>
             </div>
-            <p className="font-display text-3xl font-medium">{formatPrice(totalSold)} ₽</p>
+            <p className="font-display text-3xl font-medium">{formatPrice(summary.sold)} ₽</p>
           </div>
         </div>
 
@@ -146,14 +131,14 @@ const Admin = () => {
             <div className="relative flex-1 max-w-sm">
               <Icon name="Search" size={16} className="absolute left-3 top-1/2 -translate-y-1/2 text-muted-foreground" />
               <Input
-                placeholder="Поиск по имени или номеру..."
+                placeholder="Имя получателя, номер карты или заказа..."
                 value={search}
                 onChange={(e) => setSearch(e.target.value)}
                 className="pl-9 h-11 font-body border-border rounded-lg"
               />
             </div>
             <span className="text-sm text-muted-foreground font-body">
-              {filtered.length} из {certificates.length}
+              {certificates.length} из {total}
             </span>
           </div>
 
@@ -165,14 +150,13 @@ const Admin = () => {
                   <TableHead className="font-body text-xs uppercase tracking-wider">Получатель</TableHead>
                   <TableHead className="font-body text-xs uppercase tracking-wider">От кого</TableHead>
                   <TableHead className="font-body text-xs uppercase tracking-wider text-right">Номинал</TableHead>
-                  <TableHead className="font-body text-xs uppercase tracking-wider text-right">Остаток</TableHead>
-                  <TableHead className="font-body text-xs uppercase tracking-wider">Статус</TableHead>
+                  <TableHead className="font-body text-xs uppercase tracking-wider">Заказ</TableHead>
                   <TableHead className="font-body text-xs uppercase tracking-wider">Дата</TableHead>
                 </TableRow>
               </TableHeader>
               <TableBody>
-                {filtered.map((cert) => (
-                  <TableRow key={cert.id} className="font-body">
+                {certificates.map((cert) => (
+                  <TableRow key={cert.clientId} className="font-body">
                     <TableCell className="font-medium text-sm">{cert.cardNumber}</TableCell>
                     <TableCell>{cert.recipientName}</TableCell>
                     <TableCell className="text-muted-foreground">
@@ -181,22 +165,15 @@ const Admin = () => {
                     <TableCell className="text-right font-display font-medium">
                       {formatPrice(cert.nominal)} ₽
                     </TableCell>
-                    <TableCell className="text-right font-display font-medium">
-                      {formatPrice(cert.balance)} ₽
-                    </TableCell>
-                    <TableCell>
-                      <Badge variant={statusMap[cert.status].variant} className="font-body text-xs font-normal">
-                        {statusMap[cert.status].label}
-                      </Badge>
-                    </TableCell>
+                    <TableCell className="text-muted-foreground text-sm">{cert.orderId || "—"}</TableCell>
                     <TableCell className="text-muted-foreground text-sm">
-                      {new Date(cert.createdAt).toLocaleDateString("ru-RU")}
+                      {new Date(cert.createdAt * 1000).toLocaleDateString("ru-RU")}
                     </TableCell>
                   </TableRow>
                 ))}
-                {filtered.length === 0 && (
+                {certificates.length === 0 && !loading && (
                   <TableRow>
-                    <TableCell colSpan={7} className="text-center py-12 text-muted-foreground font-body">
+                    <TableCell colSpan={6} className="text-center py-12 text-muted-foreground font-body">
                       <Icon name="SearchX" size={24} className="mx-auto mb-2 opacity-30" />
                       Ничего не найдено
                     </TableCell>
@@ -205,6 +182,20 @@ const Admin = () => {
               </TableBody>
             </Table>
           </div>
+
+          {nextCursor && (
+            <div className="flex justify-center mt-6">
+              <Button
+                variant="outline"
+                className="font-body"
+                disabled={loading}
+                onClick={() => loadPage(search, nextCursor)}
+              >
+                {loading ? <Icon name="Loader2" size={16} className="mr-2 animate-spin" /> : null}
+                Показать ещё
+              </Button>
+            </div>
+          )}
         </div>
       </main>
     </div>
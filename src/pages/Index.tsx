@@ -1,4 +1,4 @@
-import { useState, useEffect } from "react";
+import { useState, useEffect, useRef } from "react";
 import Icon from "@/components/ui/icon";
 import CertificatePreview from "@/components/CertificatePreview";
 import CertificateResult from "@/components/CertificateResult";
@@ -8,6 +8,10 @@ import { useToast } from "@/hooks/use-toast";
 
 const API_PAYMENT = "https://functions.poehali.dev/28ebfe42-6eba-4610-b7d1-b818a4579cd6";
 const API_CHECK = "https://functions.poehali.dev/ff05838a-d8e7-43a7-9b9e-006f28780541";
+const PENDING_RETRY_MS = 1000;
+// Сервер держит запрос до окончательного статуса оплаты, но не дольше PAYMENT_WAIT_SECONDS
+const PAYMENT_WAIT_SECONDS = 20;
+const MAX_WAIT_ROUNDS = 3;
 const NOMINALS = [1000, 2000, 3000, 5000, 7000, 10000];
 
 interface CertificateData {
@@ -30,6 +34,7 @@ const Index = () => {
   const [isProcessing, setIsProcessing] = useState(false);
   const [certificate, setCertificate] = useState<CertificateData | null>(null);
   const [paymentChecking, setPaymentChecking] = useState(false);
+  const paymentKey = useRef("");
   const { toast } = useToast();
 
   const currentNominal = selectedNominal || (customNominal ? parseInt(customNominal) : 0);
@@ -44,17 +49,41 @@ const Index = () => {
     }
   }, []);
 
-  const checkPayment = async (orderId: string) => {
+  // Новый ключ идемпотентности только при смене данных платежа: повторная отправка той же формы вернёт тот же заказ
+  useEffect(() => {
+    paymentKey.current = "";
+  }, [currentNominal, recipientName, senderName]);
+
+  const checkPayment = async (orderId: string, round = 0) => {
     setPaymentChecking(true);
     setStep(0);
+    let retrying = false;
     try {
       const response = await fetch(API_CHECK, {
         method: "POST",
         headers: { "Content-Type": "application/json" },
-        body: JSON.stringify({ orderId }),
+        body: JSON.stringify({ orderId, waitSeconds: PAYMENT_WAIT_SECONDS }),
       });
       const data = await response.json();
 
+      if (data.paid && data.pending) {
+        retrying = true;
+        setTimeout(() => checkPayment(orderId, round), PENDING_RETRY_MS);
+        return;
+      }
+
+      if (response.status === 503 && data.retryable) {
+        retrying = true;
+        setTimeout(() => checkPayment(orderId, round), (data.retryAfter || 3) * 1000);
+        return;
+      }
+
+      if (!data.paid && data.final === false && round + 1 < MAX_WAIT_ROUNDS) {
+        retrying = true;
+        checkPayment(orderId, round + 1);
+        return;
+      }
+
       if (data.paid && data.success && data.certificate) {
         setCertificate(data.certificate);
         setStep(4);
@@ -70,7 +99,7 @@ const Index = () => {
       toast({ title: "Ошибка", description: "Не удалось проверить оплату", variant: "destructive" });
       setStep(1);
     } finally {
-      setPaymentChecking(false);
+      if (!retrying) setPaymentChecking(false);
     }
   };
 
@@ -94,10 +123,11 @@ const Index = () => {
     setIsProcessing(true);
     try {
       const returnUrl = window.location.origin + window.location.pathname;
+      paymentKey.current ||= crypto.randomUUID();
 
       const response = await fetch(API_PAYMENT, {
         method: "POST",
-        headers: { "Content-Type": "application/json" },
+        headers: { "Content-Type": "application/json", "Idempotency-Key": paymentKey.current },
         body: JSON.stringify({
           recipientName: recipientName.trim(),
           senderName: senderName.trim(),
@@ -5,6 +5,10 @@ import CertificateResult from "@/components/CertificateResult";
 import { Button } from "@/components/ui/button";
 
 const CHECK_PAYMENT_URL = "https://functions.poehali.dev/ff05838a-d8e7-43a7-9b9e-006f28780541";
+const PENDING_RETRY_MS = 1000;
+// Сервер держит запрос до окончательного статуса оплаты, но не дольше PAYMENT_WAIT_SECONDS
+const PAYMENT_WAIT_SECONDS = 20;
+const MAX_WAIT_ROUNDS = 3;
 
 interface CertificateData {
   clientId: string;
@@ -35,22 +39,34 @@ const PaymentReturn = () => {
     checkPayment(orderId);
   }, [searchParams]);
 
-  const checkPayment = async (orderId: string) => {
+  const checkPayment = async (orderId: string, round = 0) => {
     try {
       const resp = await fetch(CHECK_PAYMENT_URL, {
         method: "POST",
         headers: { "Content-Type": "application/json" },
-        body: JSON.stringify({ orderId }),
+        body: JSON.stringify({ orderId, waitSeconds: PAYMENT_WAIT_SECONDS }),
       });
       const data = await resp.json();
 
+      if (resp.status === 503 && data.retryable) {
+        setTimeout(() => checkPayment(orderId, round), (data.retryAfter || 3) * 1000);
+        return;
+      }
+
       if (!resp.ok) {
         setState("error");
         setErrorMsg(data.error || "Ошибка проверки платежа");
         return;
       }
 
-      if (data.paid && data.certificate) {
+      if (!data.paid && data.final === false && round + 1 < MAX_WAIT_ROUNDS) {
+        checkPayment(orderId, round + 1);
+        return;
+      }
+
+      if (data.paid && data.pending) {
+        setTimeout(() => checkPayment(orderId, round), PENDING_RETRY_MS);
+      } else if (data.paid && data.certificate) {
         setCertificate(data.certificate);
         setState("success");
       } else if (data.paid && data.error) {